@@ -0,0 +1,242 @@
+import asyncio
+import time
+import urllib.parse
+
+import aiohttp
+
+import ferry_scraper
+import html_archive
+from resilience import AIMDController, backoff_delay, is_transient, classify, RETRY_ATTEMPTS
+from metrics import registry
+from ferry_scraper import (
+    USER_AGENTS,
+    search_url_for,
+    needs_browser,
+    fetch_page_selenium,
+    parse_search_page,
+    save_schedules,
+)
+
+# -------------------- Configuration --------------------
+# Every search goes to SEARCH_URL's host, so searches in flight are capped by
+# min(MAX_IN_FLIGHT, PER_HOST_LIMIT). In practice the token bucket is the limit:
+# about REQUESTS_PER_SECOND x response time searches are in flight on average.
+MAX_IN_FLIGHT = 16           # Upper bound of the AIMD limit on searches in flight
+PER_HOST_LIMIT = 16          # Concurrent connections/searches per host
+REQUESTS_PER_SECOND = 4.0    # Token-bucket refill rate (site-wide politeness limit)
+BURST = 8                    # Token-bucket capacity
+REQUEST_TIMEOUT = 30
+# Pages are fetched with aiohttp; "auto" falls back to Chrome only for JavaScript shells.
+# FETCH_BACKEND = "selenium" is not supported in this mode.
+SUPPORTED_BACKENDS = ("auto", "http")
+
+# -------------------- Rate limiting --------------------
+
+class TokenBucket:
+    """Asyncio token bucket: `rate` tokens per second, at most `capacity` stored."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class HostLimiter:
+    """Per-host concurrency ceiling plus a per-host token bucket."""
+
+    def __init__(self, per_host_limit=PER_HOST_LIMIT, rate=REQUESTS_PER_SECOND, burst=BURST):
+        self.per_host_limit = per_host_limit
+        self.rate = rate
+        self.burst = burst
+        self.semaphores = {}
+        self.buckets = {}
+
+    def for_url(self, url):
+        """Return the (semaphore, bucket) pair for the URL's host."""
+        host = urllib.parse.urlsplit(url).netloc
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+            self.buckets[host] = TokenBucket(self.rate, self.burst)
+        return self.semaphores[host], self.buckets[host]
+
+class AdaptiveGate:
+    """Asyncio counterpart of `AIMDController.slot()`: admits up to `controller.limit` searches at once."""
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.controller.limit)
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc_info):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+async def wait_for_breaker(breaker):
+    """Sleep while the site-wide circuit breaker is open."""
+    while (remaining := breaker.pause_remaining()) > 0:
+        await asyncio.sleep(min(remaining, 5.0))
+
+# -------------------- Pipeline --------------------
+
+async def fetch_html(session, limiter, url):
+    """Fetch a search page, honouring the host's concurrency ceiling and request rate."""
+    semaphore, bucket = limiter.for_url(url)
+    async with semaphore:
+        with registry.timer("rate_limit_wait"):
+            await bucket.acquire()
+        with registry.timer("fetch_http"):
+            async with session.get(url) as response:
+                response.raise_for_status()
+                html = await response.text()
+    if ferry_scraper.FETCH_BACKEND == "auto" and needs_browser(html):
+        # JavaScript shell (no results and no "nothing found" answer): use the browser in a worker thread.
+        html = await asyncio.to_thread(fetch_page_selenium, url, REQUEST_TIMEOUT, "tableout")
+    return html
+
+async def scrape_task(session, limiter, task):
+    """Async counterpart of `ferry_scraper.scrape_route`; returns the number of schedules saved, raises on failure."""
+    from_loc, to_loc, journey_date = task
+    url = search_url_for(from_loc, to_loc, journey_date)
+    print(f"Scraping route: {from_loc} -> {to_loc} for {journey_date}")
+    try:
+        html = await fetch_html(session, limiter, url)
+    except Exception as e:
+        registry.inc("errors_total", kind=classify(e))
+        raise
+    registry.inc("pages_total")
+    if ferry_scraper.ARCHIVE_HTML:
+        await asyncio.to_thread(html_archive.archive_page, url, html)
+    # Parsing and handing rows to the writer can block, so keep them off the event loop.
+    schedules = await asyncio.to_thread(parse_search_page, html, journey_date)
+    registry.inc("schedules_total", len(schedules))
+    if ferry_scraper.change_feed is not None:
+        await asyncio.to_thread(ferry_scraper.change_feed.record, task, schedules)
+    if schedules:
+        await asyncio.to_thread(save_schedules, schedules)
+        print(f"Found {len(schedules)} schedules for {from_loc} -> {to_loc}")
+    return len(schedules)
+
+async def run_pipeline(tasks=None, max_in_flight=MAX_IN_FLIGHT, limiter=None, ledger=None, controller=None):
+    """Scrape with up to `max_in_flight` concurrent searches (at most the per-host limit,
+    since all searches go to one host); returns total schedules.
+
+    Tasks come from the `tasks` list, or are claimed one by one from a
+    `JobLedger` (and marked done/failed there) when `ledger` is given. An AIMD
+    controller adapts the number of searches in flight, the site-wide circuit
+    breaker pauses the sweep during outages, and failed searches are retried
+    after an exponential backoff before they go to the dead-letter list."""
+    limiter = limiter or HostLimiter()
+    max_in_flight = min(max_in_flight, limiter.per_host_limit)  # One host: more would only queue
+    controller = controller or AIMDController(limiter.per_host_limit, minimum=1, maximum=max_in_flight)
+    gate = AdaptiveGate(controller)
+    breaker = ferry_scraper.site_breaker
+    dead_letters = ferry_scraper.dead_letters
+    queue = asyncio.Queue()
+    for task in tasks or []:
+        queue.put_nowait(task)
+    attempts = {}       # task -> attempts so far (task-list mode)
+    retries_waiting = 0
+
+    def requeue(task):
+        nonlocal retries_waiting
+        retries_waiting -= 1
+        queue.put_nowait(task)
+
+    async def next_task():
+        while True:
+            if ledger is not None:
+                task = await asyncio.to_thread(ledger.claim_one)
+                if task is not None:
+                    return task
+                retry_in = await asyncio.to_thread(ledger.next_retry_in)
+                if retry_in is None:
+                    return None
+                await asyncio.sleep(min(retry_in, 5.0) + 0.1)
+                continue
+            try:
+                return queue.get_nowait()
+            except asyncio.QueueEmpty:
+                if not retries_waiting:
+                    return None
+                await asyncio.sleep(0.5)
+
+    async def handle_failure(task, error):
+        nonlocal retries_waiting
+        breaker.record_failure(error)
+        controller.record(error)
+        if ledger is not None:
+            tries = await asyncio.to_thread(ledger.mark_failed, task, error, backoff_delay)
+            retry = tries < ledger.max_attempts
+        else:
+            tries = attempts[task] = attempts.get(task, 0) + 1
+            retry = tries < RETRY_ATTEMPTS and is_transient(error)
+            if retry:
+                retries_waiting += 1
+                asyncio.get_running_loop().call_later(backoff_delay(tries), requeue, task)
+        if retry:
+            registry.inc("retries_total")
+            print(f"Error scraping route {task[0]} -> {task[1]} (attempt {tries}, will retry): {error}")
+        else:
+            print(f"Giving up on route {task[0]} -> {task[1]} for {task[2]} after {tries} attempts: {error}")
+            dead_letters.add("scrape", task, error, tries)
+
+    connector = aiohttp.TCPConnector(limit=max_in_flight, limit_per_host=limiter.per_host_limit)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    headers = {"User-Agent": USER_AGENTS[0], "Accept-Language": "en-US,en;q=0.9"}
+    total = 0
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+        async def worker():
+            nonlocal total
+            while True:
+                await wait_for_breaker(breaker)
+                if (task := await next_task()) is None:
+                    return
+                try:
+                    async with gate:
+                        count = await scrape_task(session, limiter, task)
+                except Exception as e:
+                    await handle_failure(task, e)
+                    continue
+                breaker.record_success()
+                controller.record_success()
+                if ledger is not None:
+                    await asyncio.to_thread(ledger.mark_done, task, count)
+                total += count
+
+        num_workers = max_in_flight if ledger is not None else min(max_in_flight, queue.qsize())
+        await asyncio.gather(*[asyncio.create_task(worker()) for _ in range(num_workers)])
+    return total
+
+def scrape_all_async(tasks=None, max_in_flight=MAX_IN_FLIGHT, per_host_limit=PER_HOST_LIMIT,
+                     requests_per_second=REQUESTS_PER_SECOND, burst=BURST, ledger=None):
+    """Run the asyncio pipeline from synchronous code (used by `ferry_scraper.main`)."""
+    if ferry_scraper.FETCH_BACKEND not in SUPPORTED_BACKENDS:
+        raise ValueError(f'SCRAPE_MODE "async" fetches with aiohttp; FETCH_BACKEND '
+                         f'"{ferry_scraper.FETCH_BACKEND}" is not supported (use "auto" or "http")')
+    print(f"Async pipeline: up to {min(max_in_flight, per_host_limit)} searches in flight, "
+          f"{requests_per_second:g} requests/s (burst {burst})")
+
+    async def run():
+        limiter = HostLimiter(per_host_limit, requests_per_second, burst)
+        return await run_pipeline(tasks, max_in_flight, limiter, ledger)
+    return asyncio.run(run())
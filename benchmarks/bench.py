@@ -0,0 +1,270 @@
+"""Offline benchmarks for the parsing hot paths and wade.fill_supplier.
+
+Runs entirely from the checked-in fixtures in benchmarks/fixtures and from
+synthetic CSVs, so no browser or network is needed:
+
+    python benchmarks/bench.py                       # parsers + fill_supplier (10k..1M rows)
+    python benchmarks/bench.py --rows 10000 10000000 # include the 10M-row case
+    python benchmarks/bench.py --compare benchmarks/results/previous.json
+    python benchmarks/bench.py --skip-parsers --skip-fill --sweep 4 8 16 --latency-ms 200 --error-rate 0.05
+
+The --sweep case runs the ledger workers end to end against the local
+stand-in site in benchmarks/mock_server.py.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+sys.path.insert(0, REPO_DIR)
+
+import ferry_scraper  # noqa: E402
+import mock_server  # noqa: E402
+
+RESULT_COUNTS = [1, 10, 50, 100]
+ROW_COUNTS = [10_000, 100_000, 1_000_000]
+RESULTS_MARKER = "<!-- RESULTS -->"
+SWEEP_DAYS = 2
+
+# -------------------- Fixtures --------------------
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+def build_search_page(num_results):
+    """Build a search page with `num_results` result blocks, alternating direct and multi-leg trips."""
+    page = read_fixture("search_page.html")
+    templates = [read_fixture("result_direct.html"), read_fixture("result_multi_leg.html")]
+    blocks = [templates[i % 2].replace("{index}", str(1000 + i)) for i in range(num_results)]
+    return page.replace(RESULTS_MARKER, "\n".join(blocks))
+
+def write_synthetic_schedules(path, num_rows, seed=42):
+    """Write a scraper-shaped CSV whose from/to/departure mostly hit timetable.csv."""
+    rng = random.Random(seed)
+    with open(os.path.join(REPO_DIR, "timetable.csv"), "r", encoding="utf-8") as f:
+        timetable = [row for row in csv.DictReader(f)]
+    keys = [(row["From"].strip(), row["To"].strip(), row["Departure"].strip()) for row in timetable]
+    infos = ["Lomprayah high speed catamaran.", "Over night boat, mattress provided.",
+             "Seatran Discovery ferry.", "LomlahkKhirin express", "", "Raja car ferry."]
+    fields = ["search_date", "from_location", "to_location", "departure_time", "arrival_time",
+              "price_adult", "operator", "information"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        for i in range(num_rows):
+            if rng.random() < 0.8:
+                from_loc, to_loc, departure = rng.choice(keys)
+            else:
+                from_loc, to_loc, departure = "Koh Tao", "Bangkok", f"{rng.randint(5, 22):02d}:00"
+            writer.writerow(["12 Feb, 2025", from_loc, to_loc, departure, "18:00",
+                             f"THB {rng.randint(200, 2000):,}", "", rng.choice(infos)])
+
+# -------------------- Measurement --------------------
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def measure(func, repeat, items_per_call=1, setup=None):
+    """Time `func` `repeat` times; report latency percentiles (ms), throughput and peak memory."""
+    latencies = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+
+    # Peak memory is measured in a separate call so tracing does not skew the timings.
+    if setup:
+        setup()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "calls": repeat,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "calls_per_s": round(repeat / total, 2) if total else None,
+        "items_per_s": round(repeat * items_per_call / total, 2) if total else None,
+        "peak_mem_kb": round(peak / 1024, 1),
+    }
+
+# -------------------- Benchmarks --------------------
+
+def bench_parsers(result_counts, repeat):
+    from parse_cache import ParseCache
+
+    ferry_scraper.PARSE_CACHE = False  # Repeated calls on one page would all be cache hits
+    results = {}
+    for num_results in result_counts:
+        html = build_search_page(num_results)
+        soup = ferry_scraper.make_results_soup(html)
+        route_tabs = [ferry_scraper.find_detail_tabs(trip_detail)["trip_route"]
+                      for _, trip_detail in ferry_scraper.iter_result_blocks(soup)]
+        cases = {
+            "extract_schedule_data": lambda: ferry_scraper.extract_schedule_data(html, "12 Feb, 2025"),
+            "extract_coordinates": lambda: ferry_scraper.extract_coordinates(html),
+            "extract_route_details": lambda: [ferry_scraper.extract_route_details(tab) for tab in route_tabs],
+            "parse_search_page": lambda: ferry_scraper.parse_search_page(html, "12 Feb, 2025"),
+        }
+        cache = ParseCache()
+        cache.parse(html, "12 Feb, 2025", ferry_scraper.parse_results)
+        cases["parse_cache_hit"] = lambda: cache.parse(html, "13 Feb, 2025", ferry_scraper.parse_results)
+        for name, func in cases.items():
+            key = f"{name}[results={num_results}]"
+            results[key] = measure(func, repeat, items_per_call=num_results)
+            print(f"{key:45s} p50={results[key]['p50_ms']:9.3f} ms  "
+                  f"{results[key]['items_per_s']:>12} results/s  peak={results[key]['peak_mem_kb']} KB")
+    return results
+
+def bench_fill_supplier(row_counts, repeat):
+    import wade
+
+    results = {}
+    lookup_csv = os.path.join(REPO_DIR, "timetable.csv")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_rows in row_counts:
+            source = os.path.join(tmp_dir, f"schedules_{num_rows}.csv")
+            target = os.path.join(tmp_dir, "target.csv")
+            write_synthetic_schedules(source, num_rows)
+            key = f"fill_supplier[rows={num_rows}]"
+            results[key] = measure(lambda: wade.fill_supplier(lookup_csv, target), repeat,
+                                   items_per_call=num_rows,
+                                   setup=lambda: shutil.copyfile(source, target))
+            print(f"{key:45s} p50={results[key]['p50_ms']:9.3f} ms  "
+                  f"{results[key]['items_per_s']:>12} rows/s  peak={results[key]['peak_mem_kb']} KB")
+    return results
+
+def run_sweep(search_url, tasks, workers, tmp_dir):
+    """Scrape `tasks` with `workers` ledger threads over HTTP; returns (seconds, schedules, ledger counts)."""
+    from concurrent.futures import ThreadPoolExecutor
+    from job_ledger import JobLedger
+    from resilience import AIMDController, CircuitBreaker, DeadLetters
+
+    ferry_scraper.SEARCH_URL = search_url
+    ferry_scraper.FETCH_BACKEND = "http"
+    ferry_scraper.ARCHIVE_HTML = False
+    ferry_scraper.CSV_FILENAME = os.path.join(tmp_dir, f"sweep_{workers}.csv")
+    ferry_scraper.site_breaker = CircuitBreaker()
+    ferry_scraper.concurrency = AIMDController(workers, minimum=1, maximum=workers)
+    ferry_scraper.dead_letters = DeadLetters(os.path.join(tmp_dir, f"dead_letters_{workers}.jsonl"))
+    ledger = JobLedger(os.path.join(tmp_dir, f"sweep_{workers}.sqlite3"))
+    ledger.add_tasks(tasks)
+    ferry_scraper.start_writer()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(open(os.devnull, "w")), ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(ferry_scraper.run_ledger_worker, ledger) for _ in range(workers)]
+            total_schedules = sum(future.result() for future in futures)
+    finally:
+        ferry_scraper.stop_writer()
+    return time.perf_counter() - start, total_schedules, ledger.counts()
+
+def bench_sweep(worker_counts, latency_ms, jitter_ms, error_rate, throttle_rate):
+    """Full-sweep throughput against the local stand-in site, per number of worker threads."""
+    site = mock_server.MockSite(latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate,
+                                throttle_rate=throttle_rate, seed=42)
+    server, search_url = mock_server.start_in_background(site)
+    dates = [f"{12 + day} Feb, 2025" for day in range(SWEEP_DAYS)]
+    tasks = [(from_loc, to_loc, date) for (from_loc, to_loc) in site.routes for date in dates]
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for workers in worker_counts:
+                requests_before = site.requests
+                seconds, schedules, counts = run_sweep(search_url, tasks, workers, tmp_dir)
+                key = f"sweep[workers={workers},latency={latency_ms:g}ms,errors={error_rate + throttle_rate:g}]"
+                results[key] = {
+                    "tasks": len(tasks), "requests": site.requests - requests_before,
+                    "done": counts.get("done", 0), "failed": counts.get("failed", 0),
+                    "schedules": schedules, "seconds": round(seconds, 3),
+                    "tasks_per_s": round(len(tasks) / seconds, 2) if seconds else None,
+                }
+                print(f"{key:45s} {results[key]['seconds']:9.3f} s  {results[key]['tasks_per_s']:>8} tasks/s  "
+                      f"{results[key]['requests']} requests, {results[key]['failed']} failed")
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+def compare(current, previous_path):
+    """Print the p50 (sweeps: total time) ratio of each benchmark against a previous results file."""
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)["benchmarks"]
+    print(f"\nComparison with {previous_path} (p50, >1.00 means slower now):")
+    for key, stats in current.items():
+        metric = "p50_ms" if "p50_ms" in stats else "seconds"
+        if key in previous and previous[key].get(metric):
+            ratio = stats[metric] / previous[key][metric]
+            flag = "  <-- regression" if ratio > 1.2 else ""
+            print(f"  {key:45s} {ratio:6.2f}x{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline parser and fill_supplier benchmarks.")
+    parser.add_argument("--results", type=int, nargs="+", default=RESULT_COUNTS,
+                        help="results per fixture page")
+    parser.add_argument("--rows", type=int, nargs="+", default=ROW_COUNTS,
+                        help="synthetic CSV sizes for fill_supplier")
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per parser case")
+    parser.add_argument("--fill-repeat", type=int, default=3, help="timed calls per fill_supplier size")
+    parser.add_argument("--skip-parsers", action="store_true")
+    parser.add_argument("--skip-fill", action="store_true")
+    parser.add_argument("--sweep", type=int, nargs="+", metavar="WORKERS",
+                        help="also run full sweeps against the mock site with these worker counts")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="mock site latency for --sweep")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="mock site latency jitter for --sweep")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="mock site 503 rate for --sweep")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="mock site 429 rate for --sweep")
+    parser.add_argument("--output", help="results JSON path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    args = parser.parse_args()
+
+    benchmarks = {}
+    if not args.skip_parsers:
+        benchmarks.update(bench_parsers(args.results, args.repeat))
+    if not args.skip_fill:
+        benchmarks.update(bench_fill_supplier(args.rows, args.fill_repeat))
+    if args.sweep:
+        benchmarks.update(bench_sweep(args.sweep, args.latency_ms, args.jitter_ms,
+                                      args.error_rate, args.throttle_rate))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "html_parser": ferry_scraper.HTML_PARSER,
+            "benchmarks": benchmarks,
+        }, f, indent=2)
+    print(f"\nResults saved to: {output}")
+
+    if args.compare:
+        compare(benchmarks, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Local stand-in for phanganferries.com/search, built from the fixtures and timetable.csv.
+
+Serves the search page with a `fromCityList` of the timetable's cities and,
+for a `loc_from`/`loc_to` search, one `tableout`/`trip-detail-main` result
+per timetable departure (map attributes included). Latency, error rates and
+result counts are configurable, so sweeps, retries and concurrency settings
+can be measured offline:
+
+    python benchmarks/mock_server.py --port 8765 --latency-ms 150 --error-rate 0.05
+    # then point the scraper at it: ferry_scraper.SEARCH_URL = "http://127.0.0.1:8765/search"
+"""
+import os
+import re
+import sys
+import csv
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+sys.path.insert(0, REPO_DIR)
+
+from stations import split_pier  # noqa: E402
+
+HOST = "127.0.0.1"
+PORT = 8765
+RESULTS_MARKER = "<!-- RESULTS -->"
+CITY_LIST_RE = re.compile(r'var\s+fromCityList\s*=\s*\[[^\]]*\];')
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+def stable_number(text, low, high):
+    """Deterministic pseudo-random number in [low, high) for a string (same on every run)."""
+    digest = int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+    return low + digest % (high - low)
+
+def coordinates(location):
+    """Stable fake coordinates somewhere in southern Thailand."""
+    return (f"{stable_number(location + 'lat', 70000, 140000) / 10000:.4f}",
+            f"{stable_number(location + 'lon', 980000, 1010000) / 10000:.4f}")
+
+def duration_text(departure, arrival):
+    dep_h, dep_m = map(int, departure.split(":"))
+    arr_h, arr_m = map(int, arrival.split(":"))
+    minutes = (arr_h * 60 + arr_m - dep_h * 60 - dep_m) % 1440
+    return f"{minutes // 60} Hr. {minutes % 60} Min."
+
+class MockSite:
+    """Timetable-backed page generator plus the fault-injection settings."""
+
+    def __init__(self, timetable_csv=os.path.join(REPO_DIR, "timetable.csv"), latency_ms=0.0,
+                 jitter_ms=0.0, error_rate=0.0, throttle_rate=0.0, results=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.results = results  # None: the timetable's departures; N: exactly N results for valid routes
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.page = read_fixture("search_page.html")
+        self.template = read_fixture("result_template.html")
+        self.routes = {}
+        cities = set()
+        with open(timetable_csv, "r", newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                row = {key.strip(): (value or "").strip() for key, value in row.items() if key}
+                from_city, from_pier = split_pier(row["From"])
+                to_city, to_pier = split_pier(row["To"])
+                cities.update((from_city, to_city))
+                self.routes.setdefault((from_city, to_city), []).append({
+                    "operator": row["Supplier"], "departure": row["Departure"], "arrival": row["Arrival"],
+                    "from_location": from_city, "to_location": to_city,
+                    "from_pier": from_pier or from_city, "to_pier": to_pier or to_city})
+        for departures in self.routes.values():
+            departures.sort(key=lambda trip: trip["departure"])
+        self.locations = sorted(cities)
+        city_list = f"var fromCityList = {json.dumps(self.locations, ensure_ascii=False)};"
+        self.page = CITY_LIST_RE.sub(lambda _: city_list, self.page)
+        self.requests = 0
+        self.errors = 0
+
+    def roll(self):
+        with self.random_lock:
+            return self.random.random()
+
+    def delay(self):
+        if self.latency_ms or self.jitter_ms:
+            with self.random_lock:
+                jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms)
+            time.sleep(max(0.0, self.latency_ms + jitter) / 1000)
+
+    def render_trip(self, trip, index, journey_date):
+        from_lat, from_lon = coordinates(trip["from_pier"])
+        to_lat, to_lon = coordinates(trip["to_pier"])
+        price = stable_number(f"{trip['from_location']}{trip['to_location']}{trip['operator']}{journey_date}", 3, 30) * 50
+        return self.template.format(
+            index=index, operator=trip["operator"], operator_slug=trip["operator"].lower().replace(" ", "-"),
+            departure=trip["departure"], arrival=trip["arrival"],
+            from_location=trip["from_location"], to_location=trip["to_location"],
+            from_pier=trip["from_pier"], to_pier=trip["to_pier"],
+            price_adult=f"{price:,}", price_child=f"{price * 3 // 4:,}",
+            duration=duration_text(trip["departure"], trip["arrival"]),
+            from_lat=from_lat, from_lon=from_lon, to_lat=to_lat, to_lon=to_lon)
+
+    def search_page(self, params):
+        """Render /search; with loc_from and loc_to, include that route's results."""
+        from_loc = params.get("loc_from", [""])[0].strip()
+        to_loc = params.get("loc_to", [""])[0].strip()
+        journey_date = params.get("journey_date", [""])[0]
+        trips = self.routes.get((from_loc, to_loc), []) if from_loc and to_loc else []
+        if trips and self.results is not None:
+            trips = [trips[i % len(trips)] for i in range(self.results)]
+        blocks = [self.render_trip(trip, 1000 + i, journey_date) for i, trip in enumerate(trips)]
+        return self.page.replace(RESULTS_MARKER, "\n".join(blocks))
+
+    def handle(self, path, params):
+        """Return (status, body) for a request, after the configured latency and faults."""
+        self.requests += 1
+        self.delay()
+        if path not in ("/", "/search"):
+            return 404, "Not found"
+        if self.throttle_rate and self.roll() < self.throttle_rate:
+            self.errors += 1
+            return 429, "Too many requests"
+        if self.error_rate and self.roll() < self.error_rate:
+            self.errors += 1
+            return 503, "Service unavailable"
+        return 200, self.search_page(params)
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    """Threading server that ignores clients dropping keep-alive connections."""
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError, ConnectionAbortedError)):
+            return
+        super().handle_error(request, client_address)
+
+def make_server(site, host=HOST, port=PORT):
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like the real site
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            status, text = site.handle(url.path.rstrip("/") or "/", parse_qs(url.query))
+            body = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return QuietHTTPServer((host, port), MockHandler)
+
+def start_in_background(site, host=HOST, port=0):
+    """Start a mock server in a daemon thread; returns (server, search URL)."""
+    server = make_server(site, host, port)
+    threading.Thread(target=server.serve_forever, name="mock-site", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/search"
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the phanganferries search site.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--timetable", default=os.path.join(REPO_DIR, "timetable.csv"))
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform +/- latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503 responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of 429 responses")
+    parser.add_argument("--results", type=int, help="results per valid route (default: timetable departures)")
+    parser.add_argument("--seed", type=int, help="random seed for latency and faults")
+    args = parser.parse_args()
+
+    site = MockSite(args.timetable, args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate,
+                    args.results, args.seed)
+    server = make_server(site, args.host, args.port)
+    print(f"Mock site with {len(site.locations)} locations and {len(site.routes)} routes on "
+          f"http://{args.host}:{args.port}/search")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served {site.requests} requests ({site.errors} injected errors)")
+
+if __name__ == "__main__":
+    main()
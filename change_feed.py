@@ -0,0 +1,112 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+from storage import CSV_FIELDS, schedule_id, row_hash, schedule_key, KEY_FIELDS
+
+# -------------------- Configuration --------------------
+SNAPSHOT_FILE = "route_snapshots.sqlite3"
+CHANGES_DIR = "changes"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    from_location TEXT NOT NULL,
+    to_location   TEXT NOT NULL,
+    journey_date  TEXT NOT NULL,
+    schedule_id   TEXT NOT NULL,
+    row_hash      TEXT NOT NULL,
+    row_json      TEXT NOT NULL,
+    PRIMARY KEY (from_location, to_location, journey_date, schedule_id)
+);
+"""
+
+def key_fields(row):
+    """Identity fields of a row as a dict, for delta records."""
+    return dict(zip(KEY_FIELDS, schedule_key(row)))
+
+def stored_row(row):
+    """The fields kept in snapshots and deltas (the CSV columns), as JSON-safe strings."""
+    return {field: None if row.get(field) is None else str(row.get(field)) for field in CSV_FIELDS}
+
+class ChangeFeed:
+    """Diff each scraped (from, to, journey_date) search against its last snapshot.
+
+    `record` compares a search's complete result with the previous one and
+    replaces the snapshot. The inserted, updated (old and new values of the
+    changed fields only) and deleted records are appended to a run file, which
+    is published as changes/changes-<timestamp>.jsonl by `finish`. Searches
+    that failed are never recorded, so they don't show up as deletions."""
+
+    def __init__(self, snapshot_file=SNAPSHOT_FILE, changes_dir=CHANGES_DIR):
+        self.conn = sqlite3.connect(snapshot_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.changes_dir = changes_dir
+        os.makedirs(changes_dir, exist_ok=True)
+        self.path = os.path.join(changes_dir, f"changes-{datetime.now():%Y%m%d-%H%M%S-%f}.jsonl")
+        self.partial_path = f"{self.path}.partial"
+        self.file = open(self.partial_path, "a", encoding="utf-8")
+        self.counts = {"insert": 0, "update": 0, "delete": 0}
+
+    def diff(self, search, previous, schedules):
+        """Return delta records between a search's previous snapshot and its new rows."""
+        current = {}
+        for row in schedules:
+            current[schedule_id(row)] = stored_row(row)
+        deltas = []
+        for sid, row in current.items():
+            if sid not in previous:
+                deltas.append({"op": "insert", "schedule_id": sid, **key_fields(row), "search": search,
+                               "old": None, "new": row})
+            elif previous[sid][0] != row_hash(row):
+                old_row = previous[sid][1]
+                changed = [field for field in CSV_FIELDS if old_row.get(field) != row.get(field)]
+                deltas.append({"op": "update", "schedule_id": sid, **key_fields(row), "search": search,
+                               "old": {field: old_row.get(field) for field in changed},
+                               "new": {field: row.get(field) for field in changed}})
+        for sid, (_, old_row) in previous.items():
+            if sid not in current:
+                deltas.append({"op": "delete", "schedule_id": sid, **key_fields(old_row), "search": search,
+                               "old": old_row, "new": None})
+        return current, deltas
+
+    def record(self, search, schedules):
+        """Compare one completed search (from, to, journey_date) with its snapshot and log the changes."""
+        search = list(search)
+        with self.lock:
+            previous = {sid: (digest, json.loads(row_json)) for sid, digest, row_json in self.conn.execute(
+                "SELECT schedule_id, row_hash, row_json FROM snapshots "
+                "WHERE from_location = ? AND to_location = ? AND journey_date = ?", search)}
+            current, deltas = self.diff(search, previous, schedules)
+            if not deltas:
+                return deltas
+            with self.conn:
+                self.conn.execute("DELETE FROM snapshots WHERE from_location = ? AND to_location = ? "
+                                  "AND journey_date = ?", search)
+                self.conn.executemany(
+                    "INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, ?)",
+                    [(*search, sid, row_hash(row), json.dumps(row)) for sid, row in current.items()])
+            changed_at = datetime.now().isoformat(timespec="seconds")
+            for delta in deltas:
+                delta["changed_at"] = changed_at
+                self.file.write(json.dumps(delta, ensure_ascii=False) + "\n")
+                self.counts[delta["op"]] += 1
+            self.file.flush()
+        return deltas
+
+    def finish(self):
+        """Publish this run's delta file (removed again when nothing changed)."""
+        with self.lock:
+            self.file.close()
+            self.conn.close()
+            if sum(self.counts.values()):
+                os.replace(self.partial_path, self.path)
+                print(f"Change feed: {self.counts['insert']} inserted, {self.counts['update']} updated, "
+                      f"{self.counts['delete']} deleted -> {self.path}")
+                return self.path
+            os.remove(self.partial_path)
+            print("Change feed: no changes since the last run")
+            return None
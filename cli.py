@@ -0,0 +1,109 @@
+"""Command-line entry point for the scraper and its maintenance tasks.
+
+    python cli.py discover [--refresh-locations]
+    python cli.py scrape [--days 7] [--mode threads|async|staged] [--continuous]
+    python cli.py fill-supplier [timetable.csv] [ferry_schedules_final_final.csv]
+    python cli.py replay [--all] [--workers N]
+
+Each command imports only the modules it needs; the scraper (and through it
+requests, BeautifulSoup or Selenium) is loaded only by the commands that fetch
+or parse pages, and pandas only by fill-supplier.
+"""
+import sys
+import argparse
+
+def configure_scraper(args):
+    """Import ferry_scraper and apply the shared command-line overrides."""
+    import ferry_scraper
+
+    if getattr(args, "search_url", None):
+        ferry_scraper.SEARCH_URL = args.search_url
+    if getattr(args, "backend", None):
+        ferry_scraper.FETCH_BACKEND = args.backend
+    if getattr(args, "sink", None):
+        ferry_scraper.OUTPUT_SINK = args.sink
+    if getattr(args, "metrics_port", None):
+        ferry_scraper.METRICS_PORT = args.metrics_port
+    return ferry_scraper
+
+def cmd_discover(args):
+    from datetime import datetime
+
+    ferry_scraper = configure_scraper(args)
+    locations = ferry_scraper.load_locations(refresh=args.refresh_locations)
+    if not locations:
+        print("No locations found.")
+        return 1
+    try:
+        valid_routes = ferry_scraper.load_or_discover_valid_routes(locations, datetime.now().strftime("%d %b, %Y"))
+    finally:
+        ferry_scraper.close_driver_pool()
+    print(f"{len(locations)} locations, {sum(len(to_locs) for to_locs in valid_routes.values())} valid routes")
+    return 0
+
+def cmd_scrape(args):
+    ferry_scraper = configure_scraper(args)
+    if args.days:
+        ferry_scraper.SCRAPE_DAYS = args.days
+    if args.mode:
+        ferry_scraper.SCRAPE_MODE = args.mode
+    ferry_scraper.main(continuous=args.continuous, refresh_locations=args.refresh_locations)
+    return 0
+
+def cmd_fill_supplier(args):
+    import wade
+
+    wade.fill_supplier(args.lookup_csv, args.target_csv, args.chunk_size or wade.CHUNK_SIZE, args.valid_routes)
+    return 0
+
+def cmd_replay(args):
+    ferry_scraper = configure_scraper(args)
+    ferry_scraper.main(replay=True, replay_all=args.all, replay_workers=args.workers)
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Ferry schedule scraper.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fetch_options = argparse.ArgumentParser(add_help=False)
+    fetch_options.add_argument("--search-url", help="search page URL (e.g. a local benchmarks/mock_server.py)")
+    fetch_options.add_argument("--backend", choices=["auto", "http", "selenium"], help="fetch backend")
+
+    output_options = argparse.ArgumentParser(add_help=False)
+    output_options.add_argument("--sink", choices=["csv", "csv-dict", "sqlite", "typed-sqlite", "parquet"],
+                                help="output sink")
+    output_options.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port")
+
+    discover = commands.add_parser("discover", parents=[fetch_options],
+                                   help="refresh the location list and the valid routes")
+    discover.add_argument("--refresh-locations", action="store_true", help="ignore the cached location list")
+    discover.set_defaults(func=cmd_discover)
+
+    scrape = commands.add_parser("scrape", parents=[fetch_options, output_options],
+                                 help="scrape schedules for the valid routes")
+    scrape.add_argument("--days", type=int, help="departure dates to cover, starting today")
+    scrape.add_argument("--mode", choices=["threads", "async", "staged"], help="scraping pipeline")
+    scrape.add_argument("--continuous", action="store_true", help="keep refreshing with the freshness scheduler")
+    scrape.add_argument("--refresh-locations", action="store_true", help="ignore the cached location list")
+    scrape.set_defaults(func=cmd_scrape)
+
+    fill = commands.add_parser("fill-supplier", help="fill the operator column from timetable.csv")
+    fill.add_argument("lookup_csv", nargs="?", default="timetable.csv")
+    fill.add_argument("target_csv", nargs="?", default="ferry_schedules_final_final.csv")
+    fill.add_argument("--chunk-size", type=int)
+    fill.add_argument("--valid-routes", help="valid_routes.json (default: next to the timetable)")
+    fill.set_defaults(func=cmd_fill_supplier)
+
+    replay = commands.add_parser("replay", parents=[output_options],
+                                 help="re-parse the HTML archive without touching the network")
+    replay.add_argument("--all", action="store_true", help="every archived page, not only the latest per search")
+    replay.add_argument("--workers", type=int, help="parser processes (default: one per CPU core)")
+    replay.set_defaults(func=cmd_replay)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import time
+import queue
+import atexit
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import psutil
+except ImportError:  # RSS-based recycling is skipped without psutil
+    psutil = None
+
+from metrics import registry, MEMORY_BUCKETS_MB
+
+# -------------------- Configuration --------------------
+MAX_PAGES_PER_DRIVER = 200   # Recycle a browser after this many page loads
+MAX_DRIVER_RSS_MB = 1024     # ... or once chromedriver + Chrome use more memory than this
+CHECKOUT_TIMEOUT = 300       # Seconds to wait for a free browser
+
+class PooledDriver:
+    """A WebDriver plus the bookkeeping the pool needs to recycle it."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created_at = time.monotonic()
+
+    def rss_mb(self):
+        """Resident memory of chromedriver and its Chrome processes (None without psutil)."""
+        if psutil is None:
+            return None
+        try:
+            process = psutil.Process(self.driver.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes if p.is_running()) / (1024 * 1024)
+        except Exception:
+            return None
+
+    def is_healthy(self):
+        """Check the browser session still answers."""
+        try:
+            self.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+class DriverPool:
+    """Bounded pool of WebDrivers with warm-up, health checks and recycling.
+
+    Browsers are created lazily up to `size` (or ahead of time with
+    `warm_up`), health-checked on checkout, replaced when dead, recycled after
+    `max_pages` page loads or `max_rss_mb` of memory, and all quit at exit."""
+
+    def __init__(self, factory, size, max_pages=MAX_PAGES_PER_DRIVER, max_rss_mb=MAX_DRIVER_RSS_MB):
+        self.factory = factory
+        self.size = size
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.idle = queue.LifoQueue()  # Reuse the most recently used (warm) browser first
+        self.created = 0
+        self.lock = threading.Lock()
+        self.closed = False
+        self.all_drivers = set()
+        atexit.register(self.close)
+
+    def create(self):
+        pooled = PooledDriver(self.factory())
+        with self.lock:
+            self.all_drivers.add(pooled)
+        return pooled
+
+    def discard(self, pooled):
+        """Quit a browser and free its slot so a replacement can be created."""
+        pooled.quit()
+        with self.lock:
+            self.all_drivers.discard(pooled)
+            self.created -= 1
+
+    def warm_up(self, count=None):
+        """Start browsers ahead of time (in parallel) so the first pages don't pay Chrome startup."""
+        with self.lock:
+            count = min(count or self.size, self.size - self.created)
+            self.created += max(count, 0)
+        if count <= 0:
+            return
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            futures = [executor.submit(self.create) for _ in range(count)]
+        for future in futures:
+            try:
+                self.idle.put(future.result())
+            except Exception as e:
+                print(f"Error starting browser during warm-up: {e}")
+                with self.lock:
+                    self.created -= 1
+        print(f"Driver pool warmed up with {self.idle.qsize()} browsers")
+
+    def acquire(self, timeout=CHECKOUT_TIMEOUT):
+        """Take a healthy browser from the pool, creating or replacing one if needed."""
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.closed:
+                raise RuntimeError("Driver pool is closed")
+            try:
+                pooled = self.idle.get_nowait()
+            except queue.Empty:
+                with self.lock:
+                    can_create = self.created < self.size
+                    if can_create:
+                        self.created += 1
+                if can_create:
+                    try:
+                        return self.create()
+                    except Exception:
+                        with self.lock:
+                            self.created -= 1
+                        raise
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("No browser became available in the driver pool")
+                try:
+                    pooled = self.idle.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+            if pooled.is_healthy():
+                return pooled
+            print("Replacing dead browser in driver pool")
+            self.discard(pooled)
+
+    def release(self, pooled, failed=False):
+        """Return a browser after use, recycling it if it is worn out or broken."""
+        pooled.pages += 1
+        if self.closed:
+            self.discard(pooled)
+            return
+        if failed and not pooled.is_healthy():
+            print("Browser crashed; it will be replaced")
+            self.discard(pooled)
+            return
+        if pooled.pages >= self.max_pages:
+            self.discard(pooled)
+            return
+        rss = pooled.rss_mb()
+        if rss is not None:
+            registry.histogram("driver_rss_release_mb", "Browser memory (MB) when returned to the pool",
+                               MEMORY_BUCKETS_MB).observe(rss)
+        if rss is not None and rss > self.max_rss_mb:
+            print(f"Recycling browser using {rss:.0f} MB after {pooled.pages} pages")
+            self.discard(pooled)
+            return
+        self.idle.put(pooled)
+
+    @contextmanager
+    def driver(self, timeout=CHECKOUT_TIMEOUT):
+        """Context manager yielding a checked-out WebDriver."""
+        pooled = self.acquire(timeout)
+        failed = False
+        try:
+            yield pooled.driver
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(pooled, failed)
+
+    def total_rss_mb(self):
+        """Memory used by all browsers of the pool (None without psutil)."""
+        with self.lock:
+            drivers = list(self.all_drivers)
+        sizes = [pooled.rss_mb() for pooled in drivers]
+        if None in sizes:
+            return None
+        return sum(sizes)
+
+    def close(self):
+        """Quit every browser the pool has started."""
+        self.closed = True
+        with self.lock:
+            drivers = list(self.all_drivers)
+            self.all_drivers.clear()
+            self.created = 0
+        for pooled in drivers:
+            pooled.quit()
+        while not self.idle.empty():
+            try:
+                self.idle.get_nowait()
+            except queue.Empty:
+                break
@@ -1,24 +1,31 @@
 import os
+import time
 # Suppress TensorFlow Lite logs
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
 import json
 import re
 import csv
-import time
 import random
 import threading
+import multiprocessing
 import urllib.parse
 import itertools
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+# requests, BeautifulSoup and Selenium are imported where they are first used,
+# so commands that never fetch or parse pages start quickly.
+import html_archive
+from job_ledger import JobLedger, LEDGER_FILE
+from driver_pool import DriverPool
+import storage
+from change_feed import ChangeFeed
+from storage import BatchWriter, CSV_FIELDS
+from resilience import (AIMDController, CircuitBreaker, DeadLetters, BudgetExhausted, retry_call, backoff_delay,
+                        status_of, classify, RETRY_ATTEMPTS)
+import metrics
+from metrics import registry, SampledProfiler
+from parse_cache import ParseCache
 
 # -------------------- Configuration --------------------
 USER_AGENTS = [
@@ -30,50 +37,319 @@ USER_AGENTS = [
 CHROME_DRIVER_PATH = r"C:\Users\USER\chromedriver\chromedriver-win64\chromedriver.exe"  # Use your path
 CSV_FILENAME = "ferry_schedules_final_final.csv"  # Changed filename
 VALID_ROUTES_FILE = "valid_routes.json"
+VALID_ROUTES_STATE_FILE = "valid_routes_state.json"  # Last-verified timestamp per route
+LOCATIONS_CACHE_FILE = "locations_cache.json"  # fromCityList, so routine runs skip the extra page load
+LOCATIONS_CACHE_TTL_HOURS = 24
+ROUTE_MAX_AGE_DAYS = 7           # Revalidate known-valid routes after this many days
+INVALID_ROUTE_MAX_AGE_DAYS = 30  # Re-check pairs with no service less often
 MAX_WORKERS = 4
+# Worker threads; the AIMD controller in resilience.py keeps between 1 and this many
+# searches in flight, starting at MAX_WORKERS and backing off on timeouts or 429/5xx.
+MAX_CONCURRENCY = MAX_WORKERS * 2
+SEARCH_URL = "https://www.phanganferries.com/search"
+# "threads" runs MAX_WORKERS blocking workers; "async" uses the asyncio
+# pipeline in async_scraper.py (per-host limits + token-bucket rate);
+# "staged" fetches in threads and parses in a process pool (staged_scraper.py).
+SCRAPE_MODE = "threads"
+# One sweep covers the departure dates from today over this many days.
+SCRAPE_DAYS = 7
+# Run continuously with the freshness scheduler (freshness_scheduler.py): each
+# route/date is refreshed on an interval based on time to departure and how often
+# its results changed, within a fixed request budget per cycle.
+CONTINUOUS = False
+# Output sink fed by the background writer: "csv", "csv-dict" (long texts as IDs
+# into lookup CSVs), "sqlite", "typed-sqlite" (typed columns, route_segments and
+# text lookup tables) or "parquet" (needs pyarrow).
+OUTPUT_SINK = "csv"
+# Diff each scraped route/date against its last snapshot and write a delta
+# stream to changes/changes-<timestamp>.jsonl at the end of the run.
+CHANGE_FEED = True
+# Keep every fetched page in the compressed, content-addressed archive so it
+# can be re-parsed later with main(replay=True).
+ARCHIVE_HTML = True
+# Serve the local read API (read_api.py) on this port while scraping; None disables it.
+# Its response cache is invalidated on every writer commit.
+READ_API_PORT = None
+# Serve Prometheus metrics (/metrics) and a JSON summary (/summary) on this port; None disables it.
+METRICS_PORT = None
+# Write per-stage timings, counters and gauges to metrics.SUMMARY_FILE when a run ends.
+METRICS_SUMMARY = True
+# Reuse the rows of an earlier, identical result page (dates and tokens stripped) and only
+# restamp search_date; the LRU size is parse_cache.PARSE_CACHE_SIZE.
+PARSE_CACHE = True
+# Sample the parse path with cProfile (metrics.PROFILE_SAMPLE_EVERY) and save metrics.PROFILE_FILE.
+PROFILE_PARSE = False
+
+# Fetch backend for search pages: "http" (pooled requests session only),
+# "selenium" (headless Chrome only) or "auto" (HTTP first, Chrome only when
+# the page has no server-rendered results and needs JavaScript).
+FETCH_BACKEND = "auto"
+HTTP_TIMEOUT = 30
+HTTP_POOL_SIZE = MAX_WORKERS
+# Browser performance profile: block heavy resources and use the "eager" page-load strategy.
+LEAN_BROWSER_PROFILE = True
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.css",
+    "*.mp4", "*.webm",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*facebook.net*", "*facebook.com/tr*", "*hotjar.com*",
+    "*maps.googleapis.com*", "*maps.gstatic.com*", "*fonts.googleapis.com*", "*fonts.gstatic.com*",
+]
+# Headless Chrome instances shared by all workers (see driver_pool.py for recycling limits)
+DRIVER_POOL_SIZE = MAX_WORKERS
+
+# lxml is several times faster than the pure-Python html.parser; fall back if missing.
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# Only the result blocks are built into the tree; headers, scripts and footers are skipped.
+RESULT_BLOCK_CLASSES = ["tableout", "trip-detail-main"]
+results_strainer = None  # SoupStrainer for RESULT_BLOCK_CLASSES, built on first parse
+
+# Shared copies of repeated texts (policies, info blocks, addresses) built up while parsing
+TEXT_POOL = {}
+TEXT_POOL_MAX = 50000
+
+# Matches the result containers the parsers need, e.g. <div class="tableout ...">
+TABLEOUT_RE = re.compile(r'class=["\'][^"\']*\btableout\b')
+# A server-rendered results section, present (empty) even when a search has no trips
+RESULTS_SECTION_RE = re.compile(r'class=["\'][^"\']*\bsearch-result\b')
+# The site's "nothing found" messages
+NO_RESULTS_RE = re.compile(
+    r'\bno\s+(?:trips?|routes?|results?|schedules?|ferries|boats)\s+(?:were\s+)?(?:found|available)'
+    r'|class=["\'][^"\']*\bno-(?:results?|trips?|data)\b', re.I)
 
 # Use a reentrant lock
 csv_lock = threading.RLock()
 thread_local = threading.local()
+schedule_writer = None
+change_feed = None
+request_budget = None                 # The freshness scheduler's RequestBudget while a cycle runs
+driver_pool = None
+driver_pool_lock = threading.Lock()
+site_breaker = CircuitBreaker()       # Pauses the sweep while the site is down
+concurrency = AIMDController(MAX_WORKERS, minimum=1, maximum=MAX_CONCURRENCY)
+dead_letters = DeadLetters()          # Searches that failed after all their retries
+parse_profiler = SampledProfiler()    # Used when PROFILE_PARSE is on
+parse_cache = ParseCache()            # Used when PARSE_CACHE is on
 
 # -------------------- Functions --------------------
 
 def setup_driver():
     """Set up and return a configured Chrome WebDriver."""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
     chrome_options = Options()
     chrome_options.add_argument("--headless")
     chrome_options.add_argument("--disable-gpu")
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
     chrome_options.add_argument(f"user-agent={random.choice(USER_AGENTS)}")
+    if LEAN_BROWSER_PROFILE:
+        # Return from driver.get at DOMContentLoaded; the waits below target the exact markers we parse.
+        chrome_options.page_load_strategy = "eager"
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_argument("--mute-audio")
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.plugins": 2,
+            "profile.managed_default_content_settings.geolocation": 2,
+            "profile.managed_default_content_settings.notifications": 2,
+        })
     service = Service(executable_path=CHROME_DRIVER_PATH)
-    return webdriver.Chrome(service=service, options=chrome_options)
+    driver = webdriver.Chrome(service=service, options=chrome_options)
+    if LEAN_BROWSER_PROFILE:
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+        except Exception as e:
+            print(f"Could not enable resource blocking: {e}")
+    return driver
+
+def wait_for_js(driver, expression, timeout):
+    """Wait until a JavaScript expression is truthy in the page."""
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    WebDriverWait(driver, timeout).until(lambda d: d.execute_script(f"return !!({expression});"))
+
+def get_driver_pool():
+    """Get the process-wide WebDriver pool (browsers are only started when first needed)."""
+    global driver_pool
+    with driver_pool_lock:
+        if driver_pool is None:
+            driver_pool = DriverPool(setup_driver, size=DRIVER_POOL_SIZE)
+    return driver_pool
+
+def close_driver_pool():
+    """Quit the pooled browsers, if any were ever needed."""
+    if driver_pool is not None:
+        driver_pool.close()
+
+def get_thread_session():
+    """Get or create a thread-local HTTP session with keep-alive connection pooling."""
+    if not hasattr(thread_local, "session"):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({
+            "User-Agent": random.choice(USER_AGENTS),
+            "Accept": "text/html,application/xhtml+xml",
+            "Accept-Language": "en-US,en;q=0.9",
+        })
+        thread_local.session = session
+    return thread_local.session
 
-def get_thread_driver():
-    """Get or create a thread-local WebDriver instance."""
-    if not hasattr(thread_local, "driver"):
-        thread_local.driver = setup_driver()
-    return thread_local.driver
+def has_results_markup(html):
+    """Check whether the HTML contains the server-rendered `tableout` result blocks."""
+    return bool(html) and TABLEOUT_RE.search(html) is not None
+
+def is_empty_results_page(html):
+    """Check whether a page without result blocks is a definite "no trips" answer (not a JS shell)."""
+    return bool(html) and (NO_RESULTS_RE.search(html) is not None or RESULTS_SECTION_RE.search(html) is not None)
+
+def needs_browser(html):
+    """Only a page with neither results nor a server-rendered empty result needs JavaScript."""
+    return not has_results_markup(html) and not is_empty_results_page(html)
+
+def charge_request():
+    """Count a request against the scheduler's request budget, if one is set."""
+    if request_budget is not None:
+        request_budget.charge()
+
+def fetch_page_http(url, timeout=HTTP_TIMEOUT, wait_class=None):
+    """Fetch a page with the pooled HTTP session (no JavaScript)."""
+    charge_request()
+    with registry.timer("fetch_http"):
+        response = get_thread_session().get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.text
+
+def fetch_page_selenium(url, timeout=30, wait_class="tableout"):
+    """Fetch a page with a pooled Chrome driver, waiting for `wait_class` (or <body>) to render."""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    charge_request()
+    checkout_started = time.perf_counter()
+    with get_driver_pool().driver() as driver:
+        registry.observe("driver_checkout", time.perf_counter() - checkout_started)
+        with registry.timer("driver_get"):
+            driver.get(url)
+        with registry.timer("driver_wait"):
+            if wait_class:
+                # Stop at the results, or as soon as the page says there are none.
+                WebDriverWait(driver, timeout).until(EC.any_of(
+                    EC.presence_of_all_elements_located((By.CLASS_NAME, wait_class)),
+                    lambda d: NO_RESULTS_RE.search(d.page_source) is not None,
+                ))
+            else:
+                # With the eager strategy the DOM is parsed once readyState leaves "loading".
+                wait_for_js(driver, 'document.body && document.readyState !== "loading"', timeout)
+        return driver.page_source
+
+def fetch_page_auto(url, timeout=30, wait_class="tableout"):
+    """Fetch over HTTP and fall back to Chrome only when the page is a JavaScript shell.
+
+    HTTP errors (429/5xx, timeouts, refused connections) are raised, not retried in
+    Chrome, so retries, the AIMD limit and the circuit breaker see them."""
+    html = fetch_page_http(url, timeout=min(timeout, HTTP_TIMEOUT))
+    # Results, or a definite empty result (a valid search with zero rows), need no browser.
+    if not needs_browser(html):
+        return html
+    return fetch_page_selenium(url, timeout, wait_class)
+
+FETCH_BACKENDS = {
+    "http": fetch_page_http,
+    "selenium": fetch_page_selenium,
+    "auto": fetch_page_auto,
+}
+
+def fetch_search_page(url, timeout=30, wait_class="tableout", backend=None):
+    """Fetch a search page with the configured backend and return its HTML."""
+    fetch = FETCH_BACKENDS[backend or FETCH_BACKEND]
+    return fetch(url, timeout=timeout, wait_class=wait_class)
+
+def parse_locations(page_source):
+    """Extract the `fromCityList` location list from a search page's source."""
+    match = re.search(r'var\s+fromCityList\s*=\s*(\[[^\]]*\]);', page_source)
+    if match:
+        locations_json = match.group(1)
+        try:
+            return json.loads(locations_json)
+        except Exception:
+            locations = locations_json.strip("[]").split(",")
+            return [loc.strip(' "\'') for loc in locations if loc.strip()]
+    return []
 
 def get_locations(driver):
     """Extract locations."""
     try:
-        driver.get("https://www.phanganferries.com/search")
-        time.sleep(2)
-        page_source = driver.page_source
-        match = re.search(r'var\s+fromCityList\s*=\s*(\[[^\]]*\]);', page_source)
-        if match:
-            locations_json = match.group(1)
-            try:
-                return json.loads(locations_json)
-            except Exception:
-                locations = locations_json.strip("[]").split(",")
-                return [loc.strip(' "\'') for loc in locations if loc.strip()]
-        return []
+        driver.get(SEARCH_URL)
+        # Wait for the fromCityList script instead of sleeping a fixed time.
+        wait_for_js(driver, "typeof fromCityList !== 'undefined'", 10)
+        locations = driver.execute_script("return fromCityList;")
+        if isinstance(locations, list):
+            return locations
+        return parse_locations(driver.page_source)
     except Exception as e:
         print(f"Error getting locations: {e}")
         return []
 
+def read_locations_cache(path=LOCATIONS_CACHE_FILE):
+    """Return (locations, fetched_at) from the location cache, or ([], None)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache["locations"], datetime.fromisoformat(cache["fetched_at"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return [], None
+
+def write_locations_cache(locations, path=LOCATIONS_CACHE_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"fetched_at": datetime.now().isoformat(timespec="seconds"), "locations": locations},
+                  f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def load_locations(refresh=False, max_age_hours=None):
+    """Return the site's location list, from the disk cache while it is fresh.
+
+    Otherwise `fromCityList` is read from the search page over HTTP; Chrome is
+    only started when the HTTP page has no list (and FETCH_BACKEND allows it).
+    If the site cannot be reached, a stale cache is better than nothing."""
+    if max_age_hours is None:
+        max_age_hours = LOCATIONS_CACHE_TTL_HOURS
+    cached, fetched_at = read_locations_cache()
+    if cached and not refresh and datetime.now() - fetched_at < timedelta(hours=max_age_hours):
+        return cached
+    locations = []
+    try:
+        locations = parse_locations(fetch_search_page(SEARCH_URL, timeout=HTTP_TIMEOUT, wait_class=None,
+                                                      backend="http"))
+    except Exception as e:
+        print(f"Could not fetch locations over HTTP: {e}")
+    if not locations and FETCH_BACKEND != "http":
+        with get_driver_pool().driver() as driver:
+            locations = get_locations(driver)
+    if locations:
+        write_locations_cache(locations)
+        return locations
+    if cached:
+        print(f"Using the cached location list from {fetched_at:%Y-%m-%d %H:%M}")
+    return cached
+
 def extract_route_details(route_div):
     """Extract route details (CORRECTED AND FINAL VERSION)."""
     route_id_elem = route_div.find("ul", class_="nav-tabs")
@@ -186,6 +462,14 @@ def extract_route_details(route_div):
 
     return route_details
 
+def intern_text(text):
+    """Return the shared copy of a repeated string so identical texts are held once in memory."""
+    if not isinstance(text, str):
+        return text
+    if len(TEXT_POOL) >= TEXT_POOL_MAX:
+        TEXT_POOL.clear()
+    return TEXT_POOL.setdefault(text, text)
+
 def extract_information(info_div):
     """Extract and return information as string"""
     information_text = ""
@@ -197,132 +481,150 @@ def extract_information(info_div):
             information_text = "\n".join(p.get_text(strip=True) for p in paragraphs)
     return information_text
 
-def extract_schedule_data(html, search_date=None):
-    """Extract schedule data from HTML."""
-    soup = BeautifulSoup(html, "html.parser")
-    schedules = []
+def make_results_soup(html):
+    """Parse only the `tableout`/`trip-detail-main` blocks of a search page."""
+    global results_strainer
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    if results_strainer is None:
+        results_strainer = SoupStrainer("div", class_=RESULT_BLOCK_CLASSES)
+    return BeautifulSoup(html, HTML_PARSER, parse_only=results_strainer)
+
+def iter_result_blocks(soup):
+    """Yield (tableout, trip-detail-main or None) pairs in page order."""
+    for item in soup.find_all("div", class_="tableout"):
+        yield item, item.find_next_sibling("div", class_="trip-detail-main")
+
+def find_detail_tabs(trip_detail_main):
+    """Index the trip detail tabs by id prefix (trip_route, trip_map, trip_info, trip_cancel) in one pass."""
+    tabs = {}
+    if trip_detail_main:
+        for div in trip_detail_main.find_all("div", id=True):
+            tab_id = div["id"]
+            if "-" in tab_id:
+                tabs.setdefault(tab_id.split("-", 1)[0], div)
+    return tabs
+
+def extract_map_coordinates(map_tab):
+    """Extract from/to lat/lon from a `trip_map-` tab ("N/A" when missing)."""
+    coordinates = {"from_lat": "N/A", "from_lon": "N/A", "to_lat": "N/A", "to_lon": "N/A"}
+    if map_tab:
+        # Find the search-map div within the map tab
+        search_map_div = map_tab.find("div", class_="search-map")
+        if search_map_div:
+            coordinates["from_lat"] = search_map_div.get("from_lat", "N/A")
+            coordinates["from_lon"] = search_map_div.get("from_long", "N/A")
+            coordinates["to_lat"] = search_map_div.get("to_lat", "N/A")
+            coordinates["to_lon"] = search_map_div.get("to_long", "N/A")
+    return coordinates
+
+def extract_schedule_item(item, tabs, search_date=None):
+    """Extract one schedule from a `tableout` block and its detail tabs (None if it is not a schedule)."""
+    # --- Basic extractions ---
+    operator_div = item.find("div", class_="wione")
+    operator_name = operator_div.find("img").get('alt', 'N/A') if operator_div and operator_div.find("img") else "N/A"
+
+    form_to_div = item.find("div", class_="form-to")
+    if not form_to_div: return None
+    from_div = form_to_div.find("div", class_="witwo")
+    from_location = from_div.find("p", class_="location").text.strip() if from_div else "N/A"
+    departure_time = from_div.find("h5", class_="time").text.strip() if from_div else "N/A"
+    to_div = form_to_div.find("div", class_="withree")
+    to_location = to_div.find("p", class_="location").text.strip() if to_div else "N/A"
+    arrival_time = to_div.find("h5", class_="time").text.strip() if to_div else "N/A"
+
+    # --- Price extraction (Simplified) ---
+    price_adult = "N/A"
+    price_child = "N/A"
+    price_div = item.find("div", class_="wifive")
+    if price_div:
+        spans = price_div.find_all("span")
+        if spans:
+            price_adult = spans[0].text.strip() if len(spans) > 0 else "N/A"
+            price_child = spans[1].text.strip() if len(spans) > 1 else "N/A"
+
+    # --- Determine vessel type ---
+    vehicle_types = []
+    transport_div = form_to_div.find("div", class_="transport-icon")
+    if transport_div:
+        if transport_div.find("img", src="/img/icon_ship.png"): vehicle_types.append("Ferry")
+        if transport_div.find("img", src="/img/icon_bus.png"): vehicle_types.append("Bus")
+    vessel = " + ".join(vehicle_types) if vehicle_types else "N/A"
+
+    # --- Detailed trip information ---
+    route_details = {}
+    information = {}
+    cancellation_policy = "N/A"
+    from_location_address = "N/A"
+    to_location_address = "N/A"
+
+    # --- Route Details ---
+    route_tab = tabs.get("trip_route")
+    if route_tab:
+        route_details = extract_route_details(route_tab)  # Use the CORRECTED function
+        # Extract addresses from route details
+        if route_details and route_details["segments"]:
+            from_location_address = route_details["segments"][0]["from"]["address"]
+            to_location_address = route_details["segments"][-1]["to"]["address"]
+
+    # --- Information ---
+    info_tab = tabs.get("trip_info")
+    if info_tab:
+        information = extract_information(info_tab)
 
-    for i, item in enumerate(soup.find_all("div", class_="tableout")):
+    # --- Cancellation Policy ---
+    cancel_tab = tabs.get("trip_cancel")
+    if cancel_tab:
+        cancel_policy_div = cancel_tab.find("div", class_="cancel-policy")
+        if cancel_policy_div:
+            cancellation_policy = "\n".join(p.get_text(strip=True) for p in cancel_policy_div.find_all("p"))
+
+    # --- Create the schedule dictionary ---
+    # Policies, information blocks, addresses and names repeat on nearly every
+    # row, so all rows share one copy of each text.
+    return {
+        'search_date': search_date,
+        'from_location': intern_text(from_location),
+        'to_location': intern_text(to_location),
+        'from_location_address': intern_text(from_location_address),
+        'to_location_address': intern_text(to_location_address),
+        'departure_time': departure_time,
+        'arrival_time': arrival_time,
+        'price_adult': price_adult,
+        'price_child': price_child,
+        'operator': intern_text(operator_name),
+        'vessel': intern_text(vessel),
+        'cancellation_policy': intern_text(cancellation_policy),
+        'route_details': json.dumps(route_details),  # Store as JSON string
+        'information': intern_text(information)
+    }
+
+def parse_results(html, search_date=None, with_coordinates=True):
+    """Single-pass parser: walk each tableout/trip-detail-main pair once and build its schedule row."""
+    schedules = []
+    for i, (item, trip_detail_main) in enumerate(iter_result_blocks(make_results_soup(html))):
         try:
-            # --- Basic extractions ---
-            operator_div = item.find("div", class_="wione")
-            operator_name = operator_div.find("img").get('alt', 'N/A') if operator_div and operator_div.find("img") else "N/A"
-
-            form_to_div = item.find("div", class_="form-to")
-            if not form_to_div: continue
-            from_div = form_to_div.find("div", class_="witwo")
-            from_location = from_div.find("p", class_="location").text.strip() if from_div else "N/A"
-            departure_time = from_div.find("h5", class_="time").text.strip() if from_div else "N/A"
-            to_div = form_to_div.find("div", class_="withree")
-            to_location = to_div.find("p", class_="location").text.strip() if to_div else "N/A"
-            arrival_time = to_div.find("h5", class_="time").text.strip() if to_div else "N/A"
-
-            # --- Price extraction (Simplified) ---
-            price_adult = "N/A"
-            price_child = "N/A"
-            price_div = item.find("div", class_="wifive")
-            if price_div:
-                spans = price_div.find_all("span")
-                if spans:
-                    price_adult = spans[0].text.strip() if len(spans) > 0 else "N/A"
-                    price_child = spans[1].text.strip() if len(spans) > 1 else "N/A"
-
-            # --- Determine vessel type ---
-            vehicle_types = []
-            transport_div = form_to_div.find("div", class_="transport-icon")
-            if transport_div:
-                if transport_div.find("img", src="/img/icon_ship.png"): vehicle_types.append("Ferry")
-                if transport_div.find("img", src="/img/icon_bus.png"): vehicle_types.append("Bus")
-            vessel = " + ".join(vehicle_types) if vehicle_types else "N/A"
-
-            # --- Find and extract detailed trip information ---
-            trip_detail_main = item.find_next_sibling("div", class_="trip-detail-main")
-            route_details = {}
-            information = {}
-            cancellation_policy = "N/A"
-            from_location_address = "N/A"
-            to_location_address = "N/A"
-
-            if trip_detail_main:
-                # --- Route Details ---
-                route_tab = trip_detail_main.find("div", id=lambda x: x and x.startswith("trip_route-"))
-                if route_tab:
-                    route_details = extract_route_details(route_tab)  # Use the CORRECTED function
-                    # Extract addresses from route details
-                    if route_details and route_details["segments"]:
-                        from_location_address = route_details["segments"][0]["from"]["address"]
-                        to_location_address = route_details["segments"][-1]["to"]["address"]
-
-                # --- Information ---
-                info_tab = trip_detail_main.find("div", id=lambda x: x and x.startswith("trip_info-"))
-                if info_tab:
-                    information = extract_information(info_tab)
-
-                # --- Cancellation Policy ---
-                cancel_tab = trip_detail_main.find("div", id=lambda x: x and x.startswith("trip_cancel-"))
-                if cancel_tab:
-                    cancel_policy_div = cancel_tab.find("div", class_="cancel-policy")
-                    if cancel_policy_div:
-                        cancellation_policy = "\n".join(p.get_text(strip=True) for p in cancel_policy_div.find_all("p"))
-
-            # --- Create the schedule dictionary ---
-            schedule = {
-                'search_date': search_date,
-                'from_location': from_location,
-                'to_location': to_location,
-                'from_location_address': from_location_address,
-                'to_location_address': to_location_address,
-                'departure_time': departure_time,
-                'arrival_time': arrival_time,
-                'price_adult': price_adult,
-                'price_child': price_child,
-                'operator': operator_name,
-                'vessel': vessel,
-                'cancellation_policy': cancellation_policy,
-                'route_details': json.dumps(route_details),  # Store as JSON string
-                'information': information
-            }
+            tabs = find_detail_tabs(trip_detail_main)
+            schedule = extract_schedule_item(item, tabs, search_date)
+            if schedule is None:
+                continue
+            if with_coordinates:
+                schedule.update(extract_map_coordinates(tabs.get("trip_map")))
             schedules.append(schedule)
-
         except Exception as e:
             print(f"Error processing schedule item {i+1}: {e}")
             continue
-
     return schedules
 
+def extract_schedule_data(html, search_date=None):
+    """Extract schedule data from HTML."""
+    return parse_results(html, search_date, with_coordinates=False)
+
 def extract_coordinates(html):
     """Extract ferry route coordinates from HTML using BeautifulSoup.
     Returns separate fields for from_lat, from_lon, to_lat, and to_lon."""
-    soup = BeautifulSoup(html, "html.parser")
-    coordinates = []
-    # For each schedule container (tableout div)
-    for tableout_div in soup.find_all("div", class_="tableout"):
-        trip_detail = tableout_div.find_next_sibling("div", class_="trip-detail-main")
-        from_lat = "N/A"
-        from_lon = "N/A"
-        to_lat = "N/A"
-        to_lon = "N/A"
-        if trip_detail:
-            # Find the map tab with id starting with "trip_map-"
-            map_tab = trip_detail.find("div", id=lambda x: x and x.startswith("trip_map-"))
-            if map_tab:
-                # Find the search-map div within the map tab
-                search_map_div = map_tab.find("div", class_="search-map")
-                if search_map_div:
-                    try:
-                        from_lat = search_map_div.get("from_lat", "N/A")
-                        from_lon = search_map_div.get("from_long", "N/A")
-                        to_lat = search_map_div.get("to_lat", "N/A")
-                        to_lon = search_map_div.get("to_long", "N/A")
-                    except Exception as e:
-                        print(f"Error extracting coordinates: {e}")
-        coordinates.append({
-            "from_lat": from_lat,
-            "from_lon": from_lon,
-            "to_lat": to_lat,
-            "to_lon": to_lon
-        })
-    return coordinates
+    return [extract_map_coordinates(find_detail_tabs(trip_detail).get("trip_map"))
+            for _, trip_detail in iter_result_blocks(make_results_soup(html))]
 
 def construct_search_url(base_url, from_location, to_location, journey_date, adult_no=1, children_no=0, children_ages=None):
     """Constructs the search URL."""
@@ -343,146 +645,426 @@ def append_to_csv(schedules, filename):
     """Append schedule data to CSV."""
     if not schedules:
         return
-    fields = ['search_date', 'from_location', 'to_location', 'from_location_address', 'to_location_address',
-              'departure_time', 'arrival_time', 'price_adult', 'price_child', 'operator', 'vessel',
-              'cancellation_policy', 'route_details', 'information',
-              'from_lat', 'from_lon', 'to_lat', 'to_lon']
+    lock_started = time.perf_counter()
     with csv_lock:
+        registry.observe("csv_lock_wait", time.perf_counter() - lock_started)
         with open(filename, mode='a', newline='', encoding='utf-8') as file:
-            writer = csv.DictWriter(file, fieldnames=fields)
+            writer = csv.DictWriter(file, fieldnames=CSV_FIELDS)
             if file.tell() == 0:
                 writer.writeheader()  # Write header only if file is empty
             for schedule in schedules:
                 writer.writerow(schedule)
 
-def scrape_route_for_date(args):
+def start_writer(kind=None, path=None):
+    """Start the background writer stage that batches rows into the configured sink."""
+    global schedule_writer
+    kind = kind or OUTPUT_SINK
+    path = path or storage.output_path(kind, CSV_FILENAME)
+    schedule_writer = BatchWriter(storage.make_sink(kind, path), dead_letters=dead_letters)
+    return schedule_writer
+
+def stop_writer():
+    """Flush and close the writer stage."""
+    global schedule_writer
+    if schedule_writer is not None:
+        schedule_writer.close()
+        stats = schedule_writer.stats
+        print(f"Writer flushed {schedule_writer.rows_written} rows in {schedule_writer.flushes} batches: "
+              f"{stats['inserted']} new, {stats['updated']} updated, {stats['unchanged']} unchanged")
+        if schedule_writer.rows_failed:
+            print(f"{schedule_writer.rows_failed} rows could not be written; see {dead_letters.path}")
+        schedule_writer = None
+
+def register_metric_gauges():
+    """Expose queue depths, browser memory and the concurrency state as gauges."""
+    registry.gauge("writer_queue_depth", "Row batches waiting for the writer thread",
+                   lambda: schedule_writer.queue.qsize() if schedule_writer is not None else 0)
+    registry.gauge("driver_pool_browsers", "Browsers started by the driver pool",
+                   lambda: driver_pool.created if driver_pool is not None else 0)
+    registry.gauge("driver_pool_idle", "Browsers waiting in the driver pool",
+                   lambda: driver_pool.idle.qsize() if driver_pool is not None else 0)
+    registry.gauge("driver_pool_rss_mb", "Memory of all pooled browsers in MB (needs psutil)",
+                   lambda: driver_pool.total_rss_mb() if driver_pool is not None else 0)
+    registry.gauge("concurrency_limit", "Current AIMD concurrency limit", lambda: concurrency.limit)
+    registry.gauge("searches_in_flight", "Searches currently being fetched", lambda: concurrency.in_flight)
+    registry.gauge("parse_cache_entries", "Parsed result pages held in the parse cache", lambda: len(parse_cache))
+    registry.gauge("circuit_open", "1 while the site-wide circuit breaker pauses the sweep",
+                   lambda: 0 if site_breaker.state == "closed" else 1)
+
+def start_metrics():
+    register_metric_gauges()
+    if METRICS_PORT:
+        metrics.start_server(registry, METRICS_PORT)
+
+def finish_metrics():
+    """Write the run summary (and the sampled parse profile) at the end of a run."""
+    if METRICS_SUMMARY:
+        print(f"Run metrics saved to {registry.write_summary(metrics.SUMMARY_FILE)}")
+    if PROFILE_PARSE:
+        parse_profiler.dump(metrics.PROFILE_FILE)
+
+def start_read_api(port=None):
+    """Serve the scraper's output through read_api.py from a background thread."""
+    import read_api
+    api = read_api.ReadAPI(storage.output_path(OUTPUT_SINK, CSV_FILENAME), VALID_ROUTES_FILE,
+                           VALID_ROUTES_STATE_FILE, locations_file=LOCATIONS_CACHE_FILE)
+    if schedule_writer is not None:
+        api.attach(schedule_writer)
+    return read_api.start_in_background(api, port=port or READ_API_PORT)
+
+def save_schedules(schedules):
+    """Hand rows to the writer stage (or append to the CSV directly when no writer is running)."""
+    if schedule_writer is not None:
+        with registry.timer("writer_enqueue"):  # Blocks only when the writer queue is full
+            schedule_writer.submit(schedules)
+    else:
+        append_to_csv(schedules, CSV_FILENAME)
+
+def search_url_for(from_loc, to_loc, journey_date):
+    """Build the schedule search URL used by the scrapers (1 adult, 1 child aged 3)."""
+    return construct_search_url(SEARCH_URL,
+                                from_loc, to_loc, journey_date,
+                                adult_no=1, children_no=1, children_ages=[3])
+
+def parse_page(html, journey_date):
+    """Run the parser on a search page (sampled by the profiler when PROFILE_PARSE is on)."""
+    if PROFILE_PARSE:
+        return parse_profiler.call(parse_results, html, journey_date)
+    return parse_results(html, journey_date)
+
+def parse_search_page(html, journey_date):
+    """Extract schedules from a search page with their map coordinates merged in (one parse)."""
+    with registry.timer("parse"):
+        if PARSE_CACHE:
+            return parse_cache.parse(html, journey_date, parse_page)
+        return parse_page(html, journey_date)
+
+def parse_archived_page(entry):
+    """Re-parse one archived page (runs in a replay worker process)."""
+    html = html_archive.read_page(entry["sha256"])
+    return parse_search_page(html, entry["journey_date"])
+
+def replay_archive(workers=None, latest_only=True):
+    """Re-run the parsers over the HTML archive in parallel, without touching the network."""
+    entries = html_archive.load_index(latest_only=latest_only)
+    print(f"Replaying {len(entries)} archived pages...")
+    total_schedules = 0
+    # Spawned (not forked) workers: the writer, metrics and read API threads are already running.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        for schedules in executor.map(parse_archived_page, entries, chunksize=16):
+            save_schedules(schedules)
+            total_schedules += len(schedules)
+    return total_schedules
+
+def fetch_route(args):
+    """Fetch (and archive) the search page of one (from, to, journey_date) task; raises on failure."""
     from_loc, to_loc, journey_date = args
-    driver = get_thread_driver()
+    url = search_url_for(from_loc, to_loc, journey_date)
+    print(f"Scraping route: {from_loc} -> {to_loc} for {journey_date}")
     try:
-        url = construct_search_url("https://www.phanganferries.com/search",
-                                     from_loc, to_loc, journey_date,
-                                     adult_no=1, children_no=1, children_ages=[3])
-        print(f"Scraping route: {from_loc} -> {to_loc} for {journey_date}")
-        driver.get(url)
-        WebDriverWait(driver, 30).until(
-            EC.presence_of_all_elements_located((By.CLASS_NAME, "tableout"))
-        )
-        schedules = extract_schedule_data(driver.page_source, journey_date)
-        
-        # Extract and integrate ferry route coordinates into separate columns
-        coordinates = extract_coordinates(driver.page_source)
-        if coordinates:
-            for schedule, coord_data in zip(schedules, coordinates):
-                schedule['from_lat'] = coord_data['from_lat']
-                schedule['from_lon'] = coord_data['from_lon']
-                schedule['to_lat'] = coord_data['to_lat']
-                schedule['to_lon'] = coord_data['to_lon']
-                
-        if schedules:
-            append_to_csv(schedules, CSV_FILENAME)
-            print(f"Found {len(schedules)} schedules for {from_loc} -> {to_loc}")
-            return len(schedules)
-        return 0
+        html = fetch_search_page(url, timeout=30, wait_class="tableout")
     except Exception as e:
-        print(f"Error scraping route {from_loc} -> {to_loc}: {e}")
-        return 0
+        registry.inc("errors_total", kind=classify(e))
+        raise
+    registry.inc("pages_total")
+    if ARCHIVE_HTML:
+        with registry.timer("archive"):
+            html_archive.archive_page(url, html)
+    return html
+
+def store_route(args, schedules):
+    """Record a parsed search in the change feed and hand its rows to the writer; returns the row count."""
+    from_loc, to_loc, _ = args
+    registry.inc("schedules_total", len(schedules))
+    if change_feed is not None:
+        with registry.timer("change_feed"):
+            change_feed.record(args, schedules)
+    if schedules:
+        save_schedules(schedules)
+        print(f"Found {len(schedules)} schedules for {from_loc} -> {to_loc}")
+    return len(schedules)
+
+def scrape_route(args):
+    """Fetch, archive, parse and save one (from, to, journey_date) search; raises on failure."""
+    with registry.timer("search"):
+        html = fetch_route(args)
+        schedules = parse_search_page(html, args[2])
+        return store_route(args, schedules)
+
+def record_task_failure(ledger, task, error):
+    """Report a failed ledger task to the breaker, the AIMD controller and the ledger.
+
+    The task is retried after a backoff, or dead-lettered once it has used up its attempts."""
+    site_breaker.record_failure(error)
+    concurrency.record(error)
+    attempts = ledger.mark_failed(task, error, backoff=backoff_delay)
+    if attempts >= ledger.max_attempts:
+        print(f"Giving up on route {task[0]} -> {task[1]} for {task[2]} after {attempts} attempts: {error}")
+        dead_letters.add("scrape", task, error, attempts)
+    else:
+        registry.inc("retries_total")
+        print(f"Error scraping route {task[0]} -> {task[1]} (attempt {attempts}, will retry): {error}")
+
+def claim_next_task(ledger):
+    """Claim the next task, waiting for backed-off retries and for tasks running elsewhere
+    (claimable if their lease expires); returns None once no work is left."""
+    while True:
+        site_breaker.wait()
+        task = ledger.claim_one()
+        if task is not None:
+            return task
+        retry_in = ledger.next_retry_in()
+        if retry_in is None:
+            return None
+        time.sleep(min(retry_in, 5.0) + 0.1)
+
+def run_ledger_worker(ledger):
+    """Claim tasks from the job ledger until none are left; returns the schedules saved.
+
+    Failed tasks are retried (by any worker) after an exponential backoff with
+    jitter; tasks that use up their attempts go to the dead-letter list."""
+    total_schedules = 0
+    while (task := claim_next_task(ledger)) is not None:
+        try:
+            with concurrency.slot():
+                count = scrape_route(task)
+        except Exception as e:
+            record_task_failure(ledger, task, e)
+            continue
+        site_breaker.record_success()
+        concurrency.record_success()
+        ledger.mark_done(task, count)
+        total_schedules += count
+    return total_schedules
 
 def validate_route(from_loc, to_loc, journey_date):
-    """Check if a route exists."""
-    driver = get_thread_driver()
-    url = construct_search_url("https://www.phanganferries.com/search", from_loc, to_loc, journey_date, adult_no=1)
+    """Check if a route exists; raises if the site could not be reached even after retries."""
+    url = construct_search_url(SEARCH_URL, from_loc, to_loc, journey_date, adult_no=1)
     try:
-        driver.get(url)
-        WebDriverWait(driver, 5).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
-        return len(driver.find_elements(By.CLASS_NAME, "tableout")) > 0
-    except Exception:
-        return False
-
-def discover_valid_routes(locations, sample_date):
-    """Build valid routes map."""
+        with concurrency.slot():
+            html = retry_call(fetch_search_page, url, timeout=5, wait_class=None,
+                              breaker=site_breaker, controller=concurrency)
+    except Exception as e:
+        status = status_of(e)
+        if status is not None and 400 <= status < 500 and status != 429:
+            return False  # The site answered that there is no such search
+        raise
+    return has_results_markup(html)
+
+def load_route_state():
+    """Load per-route verification state: {from: {to: {"valid": bool, "verified_at": iso}}}.
+
+    The first time, the state is seeded from VALID_ROUTES_FILE using the file's
+    modification time as the verification time of its routes; pairs of its
+    locations that the file does not list are seeded as invalid, so they are
+    not all re-checked on the first run."""
+    if os.path.exists(VALID_ROUTES_STATE_FILE):
+        with open(VALID_ROUTES_STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    state = {"locations": [], "routes": {}}
+    if os.path.exists(VALID_ROUTES_FILE):
+        verified_at = datetime.fromtimestamp(os.path.getmtime(VALID_ROUTES_FILE)).isoformat(timespec="seconds")
+        with open(VALID_ROUTES_FILE, 'r', encoding='utf-8') as f:
+            for from_loc, to_loc_list in json.load(f).items():
+                for to_loc in to_loc_list:
+                    state["routes"].setdefault(from_loc, {})[to_loc] = {"valid": True, "verified_at": verified_at}
+        state["locations"] = sorted(set(state["routes"]) | {t for dests in state["routes"].values() for t in dests})
+        for from_loc in state["locations"]:
+            destinations = state["routes"].setdefault(from_loc, {})
+            for to_loc in state["locations"]:
+                if to_loc != from_loc and to_loc not in destinations:
+                    destinations[to_loc] = {"valid": False, "verified_at": verified_at}
+    return state
+
+def valid_routes_from_state(state, locations):
+    """Build the {from: [to, ...]} map of valid routes between currently listed locations."""
+    listed = set(locations)
     valid_routes = {}
-    total_combinations = len(locations) * (len(locations) - 1)
-    print(f"Discovering valid routes from {total_combinations} possible combinations...")
+    for from_loc, destinations in state["routes"].items():
+        if from_loc not in listed:
+            continue
+        for to_loc, status in destinations.items():
+            if status["valid"] and to_loc in listed:
+                valid_routes.setdefault(from_loc, []).append(to_loc)
+    return valid_routes
+
+def save_route_state(state, locations):
+    """Persist the route state and the derived VALID_ROUTES_FILE."""
+    with open(VALID_ROUTES_STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    with open(VALID_ROUTES_FILE, 'w', encoding='utf-8') as f:
+        json.dump(valid_routes_from_state(state, locations), f, indent=2)
+
+def is_route_stale(status, now=None):
+    """Check whether a route's last verification is older than its max age."""
+    if not status or not status.get("verified_at"):
+        return True
+    max_age_days = ROUTE_MAX_AGE_DAYS if status["valid"] else INVALID_ROUTE_MAX_AGE_DAYS
+    verified_at = datetime.fromisoformat(status["verified_at"])
+    return (now or datetime.now()) - verified_at > timedelta(days=max_age_days)
+
+def plan_route_checks(state, locations, now=None):
+    """Return the (from, to) pairs that need validating, most promising first:
+    stale known-valid routes, then reverses of valid routes, then everything else."""
+    routes = state["routes"]
+    known_valid = {(f, t) for f, dests in routes.items() for t, status in dests.items() if status["valid"]}
+    pending = [(from_loc, to_loc) for from_loc, to_loc in itertools.product(locations, repeat=2)
+               if from_loc != to_loc and is_route_stale(routes.get(from_loc, {}).get(to_loc), now)]
 
-    route_combinations = [(from_loc, to_loc) for from_loc, to_loc in itertools.product(locations, repeat=2) if from_loc != to_loc]
+    def priority(pair):
+        if pair in known_valid:
+            return 0
+        if (pair[1], pair[0]) in known_valid:
+            return 1
+        return 2
+    return sorted(pending, key=priority)
+
+def discover_valid_routes(locations, sample_date, state=None):
+    """Build valid routes map, revalidating only stale routes and pairs with newly listed locations."""
+    state = state if state is not None else load_route_state()
+    new_locations = [loc for loc in locations if loc not in state["locations"]]
+    if new_locations:
+        print(f"New locations listed: {', '.join(new_locations)}")
+    state["locations"] = list(locations)
+
+    route_combinations = plan_route_checks(state, locations)
+    total_combinations = len(locations) * (len(locations) - 1)
+    print(f"Discovering valid routes: {len(route_combinations)} of {total_combinations} combinations need checking...")
 
     with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
         future_to_route = {executor.submit(validate_route, from_loc, to_loc, sample_date): (from_loc, to_loc)
                            for from_loc, to_loc in route_combinations}
-        for future in future_to_route:
+        skipped = 0
+        for future in as_completed(future_to_route):
             try:
                 from_loc, to_loc = future_to_route[future]
                 is_valid = future.result()
+                state["routes"].setdefault(from_loc, {})[to_loc] = {
+                    "valid": bool(is_valid),
+                    "verified_at": datetime.now().isoformat(timespec="seconds"),
+                }
                 if is_valid:
-                    valid_routes.setdefault(from_loc, []).append(to_loc)
                     print(f"Valid route found: {from_loc} -> {to_loc}")
+                    # Persist as we go so an interrupted discovery keeps what it found.
+                    save_route_state(state, locations)
+            except BudgetExhausted:
+                skipped += 1  # Checked in a later cycle
             except Exception as e:
-                print(f"Error processing route validation: {e}")
+                # Keep the route's previous status; it is checked again on the next run.
+                print(f"Could not validate route {from_loc} -> {to_loc}: {e}")
+                dead_letters.add("validate", (from_loc, to_loc, sample_date), e, RETRY_ATTEMPTS)
+    if skipped:
+        print(f"Request budget spent; {skipped} route checks postponed")
 
-    with open(VALID_ROUTES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(valid_routes, f, indent=2)
-    return valid_routes
+    save_route_state(state, locations)
+    return valid_routes_from_state(state, locations)
 
 def load_or_discover_valid_routes(locations, sample_date):
-    """Load or discover valid routes."""
-    if os.path.exists(VALID_ROUTES_FILE):
-        with open(VALID_ROUTES_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    """Load valid routes, refreshing only stale or newly listed routes."""
     return discover_valid_routes(locations, sample_date)
 
+def build_scraping_tasks(valid_routes, start_date, num_days):
+    """Expand the valid routes map into (from, to, journey_date) tasks, day by day."""
+    scraping_tasks = []
+    for day_index in range(num_days):
+        current_date = start_date + timedelta(days=day_index)
+        journey_date = current_date.strftime("%d %b, %Y")
+        for from_loc, to_loc_list in valid_routes.items():
+            for to_loc in to_loc_list:
+                scraping_tasks.append((from_loc, to_loc, journey_date))
+    return scraping_tasks
+
 # -------------------- Main Script --------------------
 
-def main():
-    base_search_url = "https://www.phanganferries.com/search"
-    # Starting from 12th February for 7 days
-    start_date = datetime(2025, 2, 12)
-    num_days = 7
+def main(replay=False, continuous=None, replay_all=False, replay_workers=None, refresh_locations=False):
+    global change_feed
+    continuous = CONTINUOUS if continuous is None else continuous
+    start_date = datetime.combine(datetime.now().date(), datetime.min.time())
+    num_days = SCRAPE_DAYS
 
     print("Starting ferry schedule scraping...")
 
-    # Write CSV header if the file does not exist or is empty
-    if not os.path.exists(CSV_FILENAME) or os.stat(CSV_FILENAME).st_size == 0:
-        csv_fields = ['search_date', 'from_location', 'to_location', 'from_location_address', 'to_location_address',
-                      'departure_time', 'arrival_time', 'price_adult', 'price_child', 'operator', 'vessel',
-                      'cancellation_policy', 'route_details', 'information',
-                      'from_lat', 'from_lon', 'to_lat', 'to_lon']
-        with open(CSV_FILENAME, mode='w', newline='', encoding='utf-8') as file:
-            writer = csv.DictWriter(file, fieldnames=csv_fields)
-            writer.writeheader()
-
-    driver = setup_driver()
+    # All rows go through one background writer; it writes the header for new files.
+    start_writer()
+    start_metrics()
+    ledger = None
+    summary = None  # Printed after the cleanup, which reports the writer and change feed totals
     try:
-        locations = get_locations(driver)
+        if READ_API_PORT:
+            start_read_api()
+
+        if replay:
+            total_schedules = replay_archive(workers=replay_workers, latest_only=not replay_all)
+            summary = f"\nReplay completed. Total schedules parsed: {total_schedules}"
+            return
+
+        if FETCH_BACKEND == "selenium":
+            get_driver_pool().warm_up()
+
+        locations = load_locations(refresh=refresh_locations)
         if not locations:
             print("No locations found. Exiting.")
             return
-    finally:
-        driver.quit()
 
-    sample_date = start_date.strftime("%d %b, %Y")
-    valid_routes = load_or_discover_valid_routes(locations, sample_date)
+        sample_date = start_date.strftime("%d %b, %Y")
+        if continuous:
+            from freshness_scheduler import run_scheduler
+            # Routes are revalidated incrementally at the start of every cycle.
+            total_schedules = run_scheduler(
+                lambda: load_or_discover_valid_routes(locations, datetime.now().strftime("%d %b, %Y")))
+            summary = f"\nScheduler stopped. Total schedules found: {total_schedules}"
+            return
 
-    scraping_tasks = []
-    for day_index in range(num_days):
-        current_date = start_date + timedelta(days=day_index)
-        journey_date = current_date.strftime("%d %b, %Y")
-        for from_loc, to_loc_list in valid_routes.items():
-            for to_loc in to_loc_list:
-                scraping_tasks.append((from_loc, to_loc, journey_date))
+        valid_routes = load_or_discover_valid_routes(locations, sample_date)
 
-    total_schedules = 0
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [executor.submit(scrape_route_for_date, task) for task in scraping_tasks]
-        for future in futures:
-            try:
-                total_schedules += future.result()
-            except Exception as e:
-                print(f"Error processing task: {e}")
+        scraping_tasks = build_scraping_tasks(valid_routes, start_date, num_days)
+
+        if CHANGE_FEED:
+            change_feed = ChangeFeed()
+
+        # A crashed (or still running) sweep is resumed without repeating finished tasks;
+        # once a sweep is complete the next run starts a fresh one. Several processes
+        # can work through the same ledger file at once.
+        ledger = JobLedger(LEDGER_FILE)
+        resumed, added = ledger.start_sweep(scraping_tasks)
+        print(f"Job ledger: {'resuming the unfinished sweep' if resumed else 'new sweep'}, "
+              f"{added} new tasks, status {ledger.counts()}")
 
-    print(f"\nScraping completed. Total schedules found: {total_schedules}")
-    print("Exiting script.")
+        if SCRAPE_MODE == "async":
+            from async_scraper import scrape_all_async
+            total_schedules = scrape_all_async(ledger=ledger)
+        elif SCRAPE_MODE == "staged":
+            from staged_scraper import run_staged
+            total_schedules = run_staged(ledger)
+        else:
+            total_schedules = 0
+            with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+                futures = [executor.submit(run_ledger_worker, ledger) for _ in range(MAX_CONCURRENCY)]
+                for future in futures:
+                    try:
+                        total_schedules += future.result()
+                    except Exception as e:
+                        print(f"Error processing task: {e}")
+
+        counts = ledger.counts()
+        print(f"Job ledger: {counts.get('done', 0)} done, {counts.get('failed', 0)} failed, "
+              f"{counts.get('pending', 0) + counts.get('running', 0)} unfinished")
+        if dead_letters.count:
+            print(f"{dead_letters.count} searches failed after all retries; see {dead_letters.path}")
+        summary = f"\nScraping completed. Total schedules found: {total_schedules}\nExiting script."
+    finally:
+        # Also after an error: quit the browsers, flush buffered rows, publish the deltas
+        # recorded so far (their snapshots are already stored) and write the run metrics.
+        close_driver_pool()
+        stop_writer()
+        if change_feed is not None:
+            change_feed.finish()
+            change_feed = None
+        if ledger is not None:
+            ledger.close()
+        finish_metrics()
+        if summary:
+            print(summary)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,237 @@
+import time
+import heapq
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import ferry_scraper
+from ferry_scraper import fetch_route, parse_search_page, store_route
+from change_feed import ChangeFeed
+from resilience import retry_call, RequestBudget, BudgetExhausted, RETRY_ATTEMPTS
+from storage import row_hash
+from metrics import registry
+
+# -------------------- Configuration --------------------
+FRESHNESS_FILE = "freshness.sqlite3"
+HORIZON_DAYS = 30            # Departure dates kept fresh, counting from today
+REQUEST_BUDGET = 200         # HTTP requests per cycle (route checks and retries included); the load on the site
+CYCLE_SECONDS = 900          # A new cycle (and budget) starts this often
+# Base refresh interval by time to departure: (departures within this many days, refresh every N hours)
+REFRESH_TIERS = ((1, 2), (3, 6), (7, 12), (14, 24), (30, 72))
+MAX_REFRESH_HOURS = 168      # Departures beyond the last tier
+MIN_REFRESH_HOURS = 0.5
+VOLATILITY_WEIGHT = 3.0      # A key whose results changed on every check is refreshed 1 + 3 = 4x as often
+VOLATILITY_ALPHA = 0.3       # Weight of the newest check in the moving average of changes
+FAILED_RETRY_MINUTES = 30    # A key whose search failed is not tried again sooner than this
+DATE_FORMAT = "%d %b, %Y"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS freshness (
+    from_location   TEXT NOT NULL,
+    to_location     TEXT NOT NULL,
+    journey_date    TEXT NOT NULL,
+    last_scraped_at TEXT,
+    last_attempt_at TEXT,
+    checks          INTEGER NOT NULL DEFAULT 0,
+    changes         INTEGER NOT NULL DEFAULT 0,
+    volatility      REAL NOT NULL DEFAULT 0,   -- moving average of "the result changed" (0..1)
+    result_hash     TEXT,
+    last_error      TEXT,
+    PRIMARY KEY (from_location, to_location, journey_date)
+);
+"""
+
+def result_hash(schedules):
+    """Order-independent fingerprint of a search result."""
+    digests = sorted(row_hash(row) for row in schedules)
+    return hashlib.sha1("\n".join(digests).encode("utf-8")).hexdigest()
+
+def refresh_interval(days_to_departure, volatility=0.0):
+    """Seconds between refreshes of a (route, date): shorter for near departures and volatile keys."""
+    hours = MAX_REFRESH_HOURS
+    for within_days, tier_hours in REFRESH_TIERS:
+        if days_to_departure < within_days:
+            hours = tier_hours
+            break
+    hours = max(MIN_REFRESH_HOURS, hours / (1 + VOLATILITY_WEIGHT * volatility))
+    return hours * 3600
+
+class FreshnessTracker:
+    """When each (from, to, journey_date) was last scraped and how often its result changed."""
+
+    def __init__(self, path=FRESHNESS_FILE):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Return {task: (last_scraped_at, last_attempt_at, volatility, checks)} with datetimes parsed."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT from_location, to_location, journey_date, last_scraped_at, last_attempt_at, "
+                "volatility, checks FROM freshness").fetchall()
+        parse = lambda value: datetime.fromisoformat(value) if value else None
+        return {(f, t, d): (parse(scraped), parse(attempted), volatility, checks)
+                for f, t, d, scraped, attempted, volatility, checks in rows}
+
+    def route_volatility(self):
+        """Mean volatility per (from, to); the prior for dates of a route that were never checked."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT from_location, to_location, AVG(volatility) FROM freshness "
+                "WHERE checks > 1 GROUP BY from_location, to_location").fetchall()
+        return {(f, t): volatility for f, t, volatility in rows}
+
+    def record_success(self, task, schedules):
+        """Store a completed search; returns True when its result differs from the previous one."""
+        digest = result_hash(schedules)
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT result_hash, volatility FROM freshness WHERE from_location = ? AND to_location = ? "
+                "AND journey_date = ?", task).fetchone()
+            changed = row is not None and row[0] is not None and row[0] != digest
+            volatility = row[1] if row else 0.0
+            if row is not None and row[0] is not None:
+                volatility = (1 - VOLATILITY_ALPHA) * volatility + VOLATILITY_ALPHA * changed
+            self.conn.execute(
+                "INSERT INTO freshness (from_location, to_location, journey_date, last_scraped_at, "
+                "last_attempt_at, checks, changes, volatility, result_hash) VALUES (?, ?, ?, ?, ?, 1, 0, ?, ?) "
+                "ON CONFLICT (from_location, to_location, journey_date) DO UPDATE SET "
+                "last_scraped_at = excluded.last_scraped_at, last_attempt_at = excluded.last_attempt_at, "
+                "checks = checks + 1, changes = changes + ?, volatility = excluded.volatility, "
+                "result_hash = excluded.result_hash, last_error = NULL",
+                (*task, now, now, volatility, digest, int(changed)))
+        return changed
+
+    def record_failure(self, task, error):
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO freshness (from_location, to_location, journey_date, last_attempt_at, last_error) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (from_location, to_location, journey_date) DO UPDATE SET "
+                "last_attempt_at = excluded.last_attempt_at, last_error = excluded.last_error",
+                (*task, now, str(error)[:1000]))
+
+    def prune(self, before_date):
+        """Forget departures that have passed."""
+        cutoff = datetime.combine(before_date, datetime.min.time())
+        with self.lock:
+            past = [key for key in self.conn.execute(
+                "SELECT from_location, to_location, journey_date FROM freshness")
+                if datetime.strptime(key[2], DATE_FORMAT) < cutoff]
+            with self.conn:
+                self.conn.executemany("DELETE FROM freshness WHERE from_location = ? AND to_location = ? "
+                                      "AND journey_date = ?", past)
+        return len(past)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def candidate_tasks(valid_routes, today, horizon_days=HORIZON_DAYS):
+    """Every (from, to, journey_date) of the valid routes within the horizon, with its days to departure."""
+    for day_index in range(horizon_days):
+        journey_date = (today + timedelta(days=day_index)).strftime(DATE_FORMAT)
+        for from_loc, to_locs in valid_routes.items():
+            for to_loc in to_locs:
+                yield (from_loc, to_loc, journey_date), day_index
+
+def plan_cycle(tracker, valid_routes, budget, now=None, horizon_days=HORIZON_DAYS):
+    """Pick up to `budget` due tasks, stalest relative to their refresh interval first.
+
+    Never-scraped tasks come first (nearest departure first); a task is due
+    once its age exceeds its refresh interval. Returns (tasks, number due)."""
+    now = now or datetime.now()
+    state = tracker.load()
+    route_prior = tracker.route_volatility()
+    retry_after = timedelta(minutes=FAILED_RETRY_MINUTES)
+    heap = []
+    for task, days in candidate_tasks(valid_routes, now.date(), horizon_days):
+        scraped_at, attempted_at, volatility, checks = state.get(task, (None, None, 0.0, 0))
+        if attempted_at and (scraped_at is None or attempted_at > scraped_at) and now - attempted_at < retry_after:
+            continue  # Failed recently; leave it to a later cycle
+        if scraped_at is None:
+            staleness = float("inf")
+        else:
+            if checks < 2:
+                volatility = route_prior.get(task[:2], volatility)
+            staleness = (now - scraped_at).total_seconds() / refresh_interval(days, volatility)
+            if staleness < 1:
+                continue
+        heap.append((-staleness, days, task))
+    due = len(heap)
+    heapq.heapify(heap)
+    return [heapq.heappop(heap)[2] for _ in range(min(budget, len(heap)))], due
+
+def refresh_task(tracker, task):
+    """Fetch, parse and store one search with retries; records its freshness. Returns the rows saved."""
+    def fetch_and_parse():
+        with registry.timer("search"):
+            return parse_search_page(fetch_route(task), task[2])
+
+    try:
+        with ferry_scraper.concurrency.slot():
+            schedules = retry_call(fetch_and_parse, breaker=ferry_scraper.site_breaker,
+                                   controller=ferry_scraper.concurrency)
+        count = store_route(task, schedules)
+    except BudgetExhausted:
+        return 0  # The cycle's requests are spent; the task stays due for the next cycle
+    except Exception as e:
+        print(f"Giving up on route {task[0]} -> {task[1]} for {task[2]}: {e}")
+        ferry_scraper.dead_letters.add("scrape", task, e, RETRY_ATTEMPTS)
+        tracker.record_failure(task, e)
+        return 0
+    if tracker.record_success(task, schedules):
+        registry.inc("freshness_changes_total")
+    return count
+
+def run_scheduler(load_routes, budget=REQUEST_BUDGET, cycle_seconds=CYCLE_SECONDS, horizon_days=HORIZON_DAYS,
+                  workers=None, cycles=None, path=FRESHNESS_FILE):
+    """Keep the next `horizon_days` of departures fresh, making at most `budget` requests per cycle.
+
+    `load_routes()` returns the valid routes map and is called at the start of
+    every cycle, so route revalidation keeps running; its requests, and every
+    retry, are charged to the cycle's budget through ferry_scraper.request_budget.
+    Runs until interrupted (or for `cycles` cycles); returns the schedules saved."""
+    workers = workers or ferry_scraper.MAX_CONCURRENCY
+    tracker = FreshnessTracker(path)
+    backlog = {"due": 0}
+    registry.gauge("freshness_due_tasks", "Tasks past their refresh interval at the last cycle",
+                   lambda: backlog["due"])
+    total_schedules = 0
+    cycle = 0
+    try:
+        while cycles is None or cycle < cycles:
+            cycle += 1
+            started = time.monotonic()
+            tracker.prune(datetime.now().date())
+            requests = ferry_scraper.request_budget = RequestBudget(budget)
+            valid_routes = load_routes()
+            tasks, backlog["due"] = plan_cycle(tracker, valid_routes, requests.remaining, horizon_days=horizon_days)
+            print(f"Cycle {cycle}: {backlog['due']} tasks due, refreshing {len(tasks)} "
+                  f"({requests.used} of {budget} requests spent on route checks)")
+            if tasks:
+                if ferry_scraper.CHANGE_FEED:
+                    ferry_scraper.change_feed = ChangeFeed()
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    saved = sum(executor.map(lambda task: refresh_task(tracker, task), tasks))
+                if ferry_scraper.change_feed is not None:
+                    ferry_scraper.change_feed.finish()
+                    ferry_scraper.change_feed = None
+                total_schedules += saved
+                print(f"Cycle {cycle}: {saved} schedules saved with {requests.used} requests "
+                      f"in {time.monotonic() - started:.0f}s")
+            ferry_scraper.request_budget = None
+            if cycles is not None and cycle >= cycles:
+                break
+            time.sleep(max(0.0, cycle_seconds - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        print("Scheduler stopped.")
+    finally:
+        ferry_scraper.request_budget = None
+        tracker.close()
+    return total_schedules
@@ -0,0 +1,94 @@
+import os
+import json
+import gzip
+import hashlib
+import threading
+import urllib.parse
+from datetime import datetime
+
+# -------------------- Configuration --------------------
+ARCHIVE_DIR = "html_archive"
+INDEX_FILENAME = "index.jsonl"
+
+index_lock = threading.Lock()
+
+# -------------------- Functions --------------------
+
+def content_hash(html):
+    """Return the SHA-256 hex digest used as the page's content address."""
+    return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+def object_path(digest, archive_dir=ARCHIVE_DIR):
+    """Path of the compressed blob for a digest (sharded by its first two characters)."""
+    return os.path.join(archive_dir, "objects", digest[:2], f"{digest[2:]}.html.gz")
+
+def url_params(url):
+    """Return the search parameters of a `construct_search_url` URL as a flat dict."""
+    return dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(url).query, keep_blank_values=True))
+
+def archive_page(url, html, fetched_at=None, archive_dir=ARCHIVE_DIR):
+    """Store a fetched page and append an index entry; identical pages share one blob."""
+    digest = content_hash(html)
+    path = object_path(digest, archive_dir)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            f.write(html)
+        os.replace(tmp_path, path)  # Atomic, so concurrent writers of the same page are safe
+
+    params = url_params(url)
+    entry = {
+        "from_location": params.get("loc_from"),
+        "to_location": params.get("loc_to"),
+        "journey_date": params.get("journey_date"),
+        "params": params,
+        "fetched_at": (fetched_at or datetime.now()).isoformat(timespec="seconds"),
+        "sha256": digest,
+        "size": len(html),
+    }
+    with index_lock:
+        with open(os.path.join(archive_dir, INDEX_FILENAME), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+    return entry
+
+def read_page(digest, archive_dir=ARCHIVE_DIR):
+    """Load an archived page by its content address."""
+    with gzip.open(object_path(digest, archive_dir), "rt", encoding="utf-8") as f:
+        return f.read()
+
+def iter_index(archive_dir=ARCHIVE_DIR):
+    """Yield every index entry in fetch order."""
+    index_path = os.path.join(archive_dir, INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        return
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def load_index(archive_dir=ARCHIVE_DIR, latest_only=True, since=None, until=None):
+    """Return index entries, optionally filtered by fetch time and reduced to the
+    latest fetch per (from_location, to_location, journey_date)."""
+    entries = []
+    for entry in iter_index(archive_dir):
+        if since and entry["fetched_at"] < since:
+            continue
+        if until and entry["fetched_at"] > until:
+            continue
+        entries.append(entry)
+    if not latest_only:
+        return entries
+    latest = {}
+    for entry in entries:
+        key = (entry["from_location"], entry["to_location"], entry["journey_date"])
+        if key not in latest or entry["fetched_at"] >= latest[key]["fetched_at"]:
+            latest[key] = entry
+    return list(latest.values())
+
+def lookup(from_location, to_location, journey_date, archive_dir=ARCHIVE_DIR):
+    """Return all archived fetches of one search, oldest first."""
+    return [entry for entry in iter_index(archive_dir)
+            if (entry["from_location"], entry["to_location"], entry["journey_date"])
+            == (from_location, to_location, journey_date)]
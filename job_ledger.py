@@ -0,0 +1,265 @@
+import os
+import socket
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+try:
+    import psutil
+except ImportError:  # Without psutil, dead workers are only detected on POSIX (or by lease expiry)
+    psutil = None
+
+# -------------------- Configuration --------------------
+LEDGER_FILE = "scrape_jobs.sqlite3"
+MAX_ATTEMPTS = 3         # Failed tasks are retried until they have been attempted this often
+LEASE_SECONDS = 300      # A running task not finished within this time is considered abandoned
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    from_location TEXT NOT NULL,
+    to_location   TEXT NOT NULL,
+    journey_date  TEXT NOT NULL,
+    journey_day   TEXT,             -- journey_date as an ISO date, for claiming in date order
+    status        TEXT NOT NULL DEFAULT 'pending',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    schedules     INTEGER,
+    worker        TEXT,
+    claimed_at    TEXT,
+    updated_at    TEXT,
+    last_error    TEXT,
+    next_attempt_at TEXT,           -- failed tasks are not retried before this time (backoff)
+    PRIMARY KEY (from_location, to_location, journey_date)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, claimed_at);
+"""
+JOURNEY_DATE_FORMAT = "%d %b, %Y"
+
+def now_iso():
+    return datetime.now().isoformat(timespec="seconds")
+
+def journey_day(journey_date):
+    """ISO form of a "dd Mon, YYYY" journey date (the text itself if it does not parse)."""
+    try:
+        return datetime.strptime(journey_date, JOURNEY_DATE_FORMAT).date().isoformat()
+    except (TypeError, ValueError):
+        return journey_date
+
+def pid_alive(pid):
+    """True if a process with this ID exists; None when that cannot be checked here."""
+    if psutil is not None:
+        return psutil.pid_exists(pid)
+    if os.name != "posix":
+        return None  # os.kill(pid, 0) would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, but belongs to another user
+    return True
+
+class JobLedger:
+    """SQLite ledger of the (from, to, journey_date) scrape tasks of one sweep.
+
+    Tasks move pending -> running -> done/failed. Claims happen inside
+    `BEGIN IMMEDIATE` transactions, so several threads or processes can share
+    one ledger file without claiming the same task twice."""
+
+    def __init__(self, path=LEDGER_FILE, max_attempts=MAX_ATTEMPTS, lease_seconds=LEASE_SECONDS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.local = threading.local()
+        conn = self.connection()
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "next_attempt_at" not in columns:  # Ledgers created before retry backoff
+            conn.execute("ALTER TABLE jobs ADD COLUMN next_attempt_at TEXT")
+        if "journey_day" not in columns:  # Ledgers that sorted on the journey_date text
+            conn.execute("ALTER TABLE jobs ADD COLUMN journey_day TEXT")
+            conn.executemany("UPDATE jobs SET journey_day = ? WHERE journey_date = ?",
+                             [(journey_day(date), date) for (date,) in
+                              conn.execute("SELECT DISTINCT journey_date FROM jobs").fetchall()])
+
+    def connection(self):
+        """Return this thread's connection (SQLite connections are not shared across threads)."""
+        if not hasattr(self.local, "conn"):
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return self.local.conn
+
+    def insert_tasks(self, conn, tasks):
+        """INSERT OR IGNORE tasks as pending; returns the number added."""
+        cursor = conn.executemany(
+            "INSERT OR IGNORE INTO jobs (from_location, to_location, journey_date, journey_day, status, updated_at) "
+            "VALUES (?, ?, ?, ?, 'pending', ?)",
+            [(from_loc, to_loc, journey_date, journey_day(journey_date), now_iso())
+             for from_loc, to_loc, journey_date in tasks])
+        return cursor.rowcount
+
+    def add_tasks(self, tasks):
+        """Register tasks; ones already in the ledger (including done ones) are left untouched."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            added = self.insert_tasks(conn, tasks)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def has_unfinished(self):
+        """True while some task is pending, running or failed with attempts left."""
+        row = self.connection().execute(
+            "SELECT 1 FROM jobs WHERE status IN ('pending', 'running') "
+            "   OR (status = 'failed' AND attempts < ?) LIMIT 1", (self.max_attempts,)).fetchone()
+        return row is not None
+
+    def start_sweep(self, tasks):
+        """Register the tasks of a sweep; returns (resumed, number of new tasks).
+
+        While the previous sweep has unfinished tasks (it crashed or another
+        process is still working on it) the new tasks join it and finished
+        ones are not repeated. Once it is complete, the ledger is cleared so
+        every task of the new sweep is scraped again. Tasks left running by a
+        crashed process on this host are made claimable again first."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.requeue_orphaned(conn)
+            resumed = self.has_unfinished()
+            if not resumed:
+                conn.execute("DELETE FROM jobs")
+            added = self.insert_tasks(conn, tasks)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return resumed, added
+
+    def requeue_orphaned(self, conn=None):
+        """Put running tasks whose worker process on this host is gone back to pending; returns how many.
+
+        Their lease would otherwise keep them unclaimable for up to `lease_seconds`."""
+        conn = conn or self.connection()
+        host = socket.gethostname()
+        orphaned = []
+        for task, worker in ((row[:3], row[3]) for row in conn.execute(
+                "SELECT from_location, to_location, journey_date, worker FROM jobs WHERE status = 'running'")):
+            worker_host, _, pid = (worker or "").rpartition(":")
+            if worker_host == host and pid.isdigit() and worker != self.worker_id and pid_alive(int(pid)) is False:
+                orphaned.append(task)
+        conn.executemany(
+            "UPDATE jobs SET status = 'pending', worker = NULL, claimed_at = NULL, updated_at = ? "
+            "WHERE from_location = ? AND to_location = ? AND journey_date = ? AND status = 'running'",
+            [(now_iso(), *task) for task in orphaned])
+        return len(orphaned)
+
+    def claim(self, limit=1):
+        """Atomically claim up to `limit` unfinished tasks for this worker.
+
+        Claimable tasks are pending ones, failed ones with attempts left whose
+        backoff has passed, and running ones whose lease expired (their worker
+        crashed or was killed)."""
+        lease_cutoff = (datetime.now() - timedelta(seconds=self.lease_seconds)).isoformat(timespec="seconds")
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT from_location, to_location, journey_date FROM jobs "
+                "WHERE (status = 'pending') "
+                "   OR (status = 'failed' AND attempts < ? AND (next_attempt_at IS NULL OR next_attempt_at <= ?)) "
+                "   OR (status = 'running' AND claimed_at < ?) "
+                "ORDER BY journey_day, attempts LIMIT ?",
+                (self.max_attempts, now_iso(), lease_cutoff, limit)).fetchall()
+            now = now_iso()
+            conn.executemany(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, "
+                "claimed_at = ?, updated_at = ? "
+                "WHERE from_location = ? AND to_location = ? AND journey_date = ?",
+                [(self.worker_id, now, now, *row) for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [tuple(row) for row in rows]
+
+    def claim_one(self):
+        """Claim a single task, or return None when no work is left."""
+        tasks = self.claim(1)
+        return tasks[0] if tasks else None
+
+    def mark_done(self, task, schedules=0):
+        self.connection().execute(
+            "UPDATE jobs SET status = 'done', schedules = ?, last_error = NULL, updated_at = ? "
+            "WHERE from_location = ? AND to_location = ? AND journey_date = ?",
+            (schedules, now_iso(), *task))
+
+    def mark_failed(self, task, error, backoff=None):
+        """Record a failed attempt; returns the attempt count (>= max_attempts means no retry is left).
+
+        `backoff(attempts)` gives the seconds to wait before the task may be claimed again."""
+        conn = self.connection()
+        row = conn.execute("SELECT attempts FROM jobs WHERE from_location = ? AND to_location = ? "
+                           "AND journey_date = ?", task).fetchone()
+        attempts = row[0] if row else self.max_attempts
+        retry_delay = backoff(attempts) if backoff else 0
+        retry_at = (datetime.now() + timedelta(seconds=retry_delay)).isoformat(timespec="seconds")
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', last_error = ?, updated_at = ?, next_attempt_at = ? "
+            "WHERE from_location = ? AND to_location = ? AND journey_date = ?",
+            (str(error)[:1000], now_iso(), retry_at, *task))
+        return attempts
+
+    def next_retry_in(self):
+        """Seconds until the earliest waiting task may become claimable, or None if none is waiting.
+
+        Waiting tasks are backed-off retries and tasks running in other processes,
+        whose lease expires if that process dies without finishing them."""
+        conn = self.connection()
+        retry_at = conn.execute(
+            "SELECT MIN(next_attempt_at) FROM jobs WHERE status = 'failed' AND attempts < ?",
+            (self.max_attempts,)).fetchone()[0]
+        claimed_at = conn.execute(
+            "SELECT MIN(claimed_at) FROM jobs WHERE status = 'running' AND worker IS NOT ?",
+            (self.worker_id,)).fetchone()[0]
+        waits = []
+        if retry_at is not None:
+            waits.append(datetime.fromisoformat(retry_at))
+        if claimed_at is not None:
+            waits.append(datetime.fromisoformat(claimed_at) + timedelta(seconds=self.lease_seconds))
+        if not waits:
+            return None
+        return max(0.0, (min(waits) - datetime.now()).total_seconds())
+
+    def reset(self, tasks=None):
+        """Mark tasks (or every task) pending again so they are re-scraped."""
+        conn = self.connection()
+        if tasks is None:
+            conn.execute("UPDATE jobs SET status = 'pending', attempts = 0, next_attempt_at = NULL, updated_at = ?",
+                         (now_iso(),))
+        else:
+            conn.executemany(
+                "UPDATE jobs SET status = 'pending', attempts = 0, next_attempt_at = NULL, updated_at = ? "
+                "WHERE from_location = ? AND to_location = ? AND journey_date = ?",
+                [(now_iso(), *task) for task in tasks])
+
+    def counts(self):
+        """Return {status: number of tasks}."""
+        rows = self.connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def failed_tasks(self):
+        """Return tasks that used up all their attempts, with their last error."""
+        return self.connection().execute(
+            "SELECT from_location, to_location, journey_date, attempts, last_error FROM jobs "
+            "WHERE status = 'failed' AND attempts >= ?", (self.max_attempts,)).fetchall()
+
+    def close(self):
+        if hasattr(self.local, "conn"):
+            self.local.conn.close()
+            del self.local.conn
@@ -0,0 +1,263 @@
+import os
+import csv
+import sqlite3
+import argparse
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+
+import normalize
+from stations import load_station_index, VALID_ROUTES_FILE
+
+# -------------------- Configuration --------------------
+SCHEDULES_FILE = "ferry_schedules_final_final.csv"  # CSV output, or the *_typed.sqlite3 database
+MIN_TRANSFER_MIN = 30        # Minimum connection time when changing between products
+MAX_SEARCH_HOURS = 48        # Give up on itineraries arriving later than this after the start time
+DAY_MINUTES = 1440
+
+csv.field_size_limit(16 * 1024 * 1024)
+
+# -------------------- Loading --------------------
+
+def iter_csv_schedules(path):
+    """Yield (typed schedule, segments) for every row of the CSV output, decoding route_details once."""
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            schedule = normalize.normalize_schedule(row)
+            yield schedule, normalize.normalize_segments(row, schedule["schedule_id"])
+
+def iter_typed_schedules(path):
+    """Yield (typed schedule, segments) from the typed-sqlite output."""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        segments = {}
+        for segment in conn.execute("SELECT * FROM route_segments ORDER BY schedule_id, seq"):
+            segments.setdefault(segment["schedule_id"], []).append(dict(segment))
+        for schedule in conn.execute("SELECT * FROM schedules"):
+            yield dict(schedule), segments.get(schedule["schedule_id"], [])
+    finally:
+        conn.close()
+
+def iter_schedules(path):
+    if path.endswith((".sqlite3", ".db")):
+        return iter_typed_schedules(path)
+    return iter_csv_schedules(path)
+
+def day_of(iso_date):
+    try:
+        return date.fromisoformat(iso_date).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+def schedule_legs(schedule, segments):
+    """(from, to, departure, arrival, transport) per leg in minutes since the search date's midnight.
+
+    Direct products without route_details become a single leg. Times are made
+    monotonic so overnight legs land on the following day."""
+    if not segments:
+        segments = [{"from_location": schedule["from_location"], "to_location": schedule["to_location"],
+                     "departure_min": schedule["departure_min"], "arrival_min": schedule["arrival_min"],
+                     "duration_min": schedule.get("duration_min"), "transport": schedule.get("vessel")}]
+    legs = []
+    clock = None
+    for segment in segments:
+        departure = segment["departure_min"]
+        if departure is None:
+            if clock is None:
+                return []
+            departure = clock + (segment.get("layover_min") or 0)
+        elif clock is not None:
+            while departure < clock:
+                departure += DAY_MINUTES
+        arrival = segment["arrival_min"]
+        if arrival is None:
+            if segment.get("duration_min") is None:
+                return []
+            arrival = departure + segment["duration_min"]
+        while arrival < departure:
+            arrival += DAY_MINUTES
+        legs.append((segment["from_location"], segment["to_location"], departure, arrival, segment.get("transport")))
+        clock = arrival
+    return legs
+
+# -------------------- Index --------------------
+
+class JourneyIndex:
+    """Array-backed connection table over the scraped schedules.
+
+    Every leg of every product is one connection (departure/arrival station,
+    absolute departure/arrival minute, trip). Connections are sorted by
+    departure time, so an earliest-arrival query is a single Connection Scan
+    from a bisected start position. Stations are canonical IDs from
+    stations.py; `departures(station, day)` is served from a (station, day)
+    index of connection numbers."""
+
+    def __init__(self, schedules, station_index, min_transfer=MIN_TRANSFER_MIN):
+        self.station_index = station_index
+        self.min_transfer = min_transfer
+        self.station_ids = []      # station number -> station ID
+        self.station_names = []    # station number -> display name
+        self.station_numbers = {}  # station ID -> station number
+        self.trips = []            # trip number -> schedule metadata
+        connections = []
+        for schedule, segments in schedules:
+            day = day_of(schedule.get("search_date"))
+            legs = schedule_legs(schedule, segments) if day is not None else []
+            if not legs:
+                continue
+            trip = len(self.trips)
+            self.trips.append({"schedule_id": schedule.get("schedule_id"), "operator": schedule.get("operator"),
+                               "price_adult": schedule.get("price_adult"), "currency": schedule.get("currency")})
+            base = day * DAY_MINUTES
+            for from_name, to_name, departure, arrival, transport in legs:
+                connections.append((base + departure, base + arrival, self.station_number(from_name),
+                                    self.station_number(to_name), trip, transport))
+        connections.sort(key=lambda c: (c[0], c[1]))
+        self.dep_time = array("q", (c[0] for c in connections))
+        self.arr_time = array("q", (c[1] for c in connections))
+        self.dep_station = array("l", (c[2] for c in connections))
+        self.arr_station = array("l", (c[3] for c in connections))
+        self.trip = array("l", (c[4] for c in connections))
+        self.transport = [c[5] for c in connections]
+        self.by_station_day = {}
+        for number, (departure, station) in enumerate(zip(self.dep_time, self.dep_station)):
+            self.by_station_day.setdefault((station, departure // DAY_MINUTES), array("l")).append(number)
+
+    def station_number(self, name):
+        sid = self.station_index.resolve(name)
+        number = self.station_numbers.get(sid)
+        if number is None:
+            number = self.station_numbers[sid] = len(self.station_ids)
+            self.station_ids.append(sid)
+            self.station_names.append(self.station_index.names.get(sid, name.strip()))
+        return number
+
+    def lookup_station(self, name):
+        number = self.station_numbers.get(self.station_index.resolve(name))
+        if number is None:
+            raise KeyError(f"Unknown station: {name}")
+        return number
+
+    def __len__(self):
+        return len(self.dep_time)
+
+    def connection(self, number):
+        trip = self.trips[self.trip[number]]
+        return {"from": self.station_names[self.dep_station[number]],
+                "to": self.station_names[self.arr_station[number]],
+                "departure": minute_to_datetime(self.dep_time[number]).isoformat(timespec="minutes"),
+                "arrival": minute_to_datetime(self.arr_time[number]).isoformat(timespec="minutes"),
+                "transport": self.transport[number], "operator": trip["operator"],
+                "schedule_id": trip["schedule_id"]}
+
+    def departures(self, station, journey_date):
+        """All connections leaving a station on a date, in departure order."""
+        numbers = self.by_station_day.get((self.lookup_station(station), to_day(journey_date)), ())
+        return [self.connection(number) for number in numbers]
+
+    def scan(self, source, target, start):
+        """Connection Scan from `source` at minute `start`; returns the itinerary reaching `target` first."""
+        ready = {source: start}    # station -> earliest time a new trip can be boarded there
+        arrival = {}               # station -> earliest arrival
+        reached_by = {}            # station -> connection it was first reached with
+        boarded_at = {}            # trip -> first connection used on it
+        horizon = start + MAX_SEARCH_HOURS * 60
+        dep_time, arr_time, trip_of = self.dep_time, self.arr_time, self.trip
+        dep_station, arr_station = self.dep_station, self.arr_station
+        for number in range(bisect_left(dep_time, start), len(dep_time)):
+            departure = dep_time[number]
+            if departure > horizon or departure >= arrival.get(target, horizon):
+                break
+            trip = trip_of[number]
+            if trip not in boarded_at:
+                if ready.get(dep_station[number], horizon + 1) > departure:
+                    continue
+                boarded_at[trip] = number
+            station = arr_station[number]
+            if arr_time[number] < arrival.get(station, horizon + 1):
+                arrival[station] = arr_time[number]
+                reached_by[station] = number
+                ready[station] = arr_time[number] + self.min_transfer
+        if target not in reached_by:
+            return None
+        return self.itinerary(source, target, reached_by, boarded_at)
+
+    def itinerary(self, source, target, reached_by, boarded_at):
+        """Walk back from the target, one trip at a time, and describe the journey."""
+        rides = []
+        station = target
+        while station != source:
+            last = reached_by[station]
+            first = boarded_at[self.trip[last]]
+            rides.append((first, last))
+            station = self.dep_station[first]
+        rides.reverse()
+        legs = []
+        for first, last in rides:
+            trip = self.trip[last]
+            legs.extend(self.connection(number) for number in range(first, last + 1) if self.trip[number] == trip)
+        trips = [self.trips[self.trip[last]] for _, last in rides]
+        currencies = {trip["currency"] for trip in trips}
+        prices = [trip["price_adult"] for trip in trips]
+        price = sum(prices) if None not in prices and len(currencies) == 1 else None
+        departure, arrival = self.dep_time[rides[0][0]], self.arr_time[rides[-1][1]]
+        return {"departure": minute_to_datetime(departure).isoformat(timespec="minutes"),
+                "arrival": minute_to_datetime(arrival).isoformat(timespec="minutes"),
+                "duration_min": arrival - departure, "transfers": len(rides) - 1,
+                "price_adult": price, "currency": currencies.pop() if price is not None else None,
+                "legs": legs}
+
+    def earliest_arrival(self, from_station, to_station, journey_date, after="00:00"):
+        """Fastest-arriving itinerary leaving `from_station` on or after `after` on `journey_date`."""
+        start = to_day(journey_date) * DAY_MINUTES + (normalize.time_to_minutes(after) or 0)
+        return self.scan(self.lookup_station(from_station), self.lookup_station(to_station), start)
+
+    def itineraries(self, from_station, to_station, journey_date):
+        """Every non-dominated itinerary departing on `journey_date` (later departure or earlier arrival)."""
+        source, target = self.lookup_station(from_station), self.lookup_station(to_station)
+        found = []
+        for number in reversed(self.by_station_day.get((source, to_day(journey_date)), ())):
+            result = self.scan(source, target, self.dep_time[number])
+            if result and (not found or result["arrival"] < found[-1]["arrival"]):
+                found.append(result)
+        found.reverse()
+        return found
+
+def to_day(journey_date):
+    if isinstance(journey_date, str):
+        journey_date = date.fromisoformat(journey_date)
+    return journey_date.toordinal()
+
+def minute_to_datetime(minute):
+    return datetime.fromordinal(minute // DAY_MINUTES) + timedelta(minutes=minute % DAY_MINUTES)
+
+def load_journey_index(path=SCHEDULES_FILE, valid_routes_file=VALID_ROUTES_FILE):
+    """Build a JourneyIndex from the scraper output (CSV or typed SQLite)."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Schedules file not found: {path}")
+    return JourneyIndex(iter_schedules(path), load_station_index(valid_routes_file))
+
+if __name__ == "__main__":
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description="Search multi-leg itineraries in the scraped schedules.")
+    parser.add_argument("from_station")
+    parser.add_argument("to_station")
+    parser.add_argument("date", help="journey date, YYYY-MM-DD")
+    parser.add_argument("--after", default="00:00", help="earliest departure time (HH:MM)")
+    parser.add_argument("--all", action="store_true", help="list every non-dominated itinerary of the day")
+    parser.add_argument("--schedules", default=SCHEDULES_FILE, help="CSV or typed SQLite output")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = load_journey_index(args.schedules)
+    print(f"Indexed {len(index)} connections in {time.perf_counter() - started:.2f}s")
+    started = time.perf_counter()
+    if args.all:
+        result = index.itineraries(args.from_station, args.to_station, args.date)
+    else:
+        result = index.earliest_arrival(args.from_station, args.to_station, args.date, args.after)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    print(f"Query took {(time.perf_counter() - started) * 1000:.1f} ms")
@@ -0,0 +1,291 @@
+import json
+import time
+import bisect
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# -------------------- Configuration --------------------
+METRICS_PREFIX = "ferry_scraper"
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+MEMORY_BUCKETS_MB = (128, 256, 512, 768, 1024, 1536, 2048, 4096)
+SUMMARY_FILE = "run_metrics.json"
+PROFILE_SAMPLE_EVERY = 50            # Profile one in this many parse calls when profiling is on
+PROFILE_FILE = "parse_profile.pstats"
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+# -------------------- Metric types --------------------
+
+class Histogram:
+    """Fixed-bucket latency histogram (per label set) with count, sum and max."""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.series = {}  # label key -> [bucket counts..., +Inf count, sum, max]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0.0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] = max(series[-1], value)
+
+    def quantile(self, series, q):
+        """Approximate quantile: the upper bound of the bucket holding it."""
+        counts = series[:len(self.buckets) + 1]
+        target = q * sum(counts)
+        running = 0
+        for bound, count in zip(self.buckets + (series[-1],), counts):
+            running += count
+            if running >= target and count:
+                return min(bound, series[-1])
+        return series[-1]
+
+    def summary(self):
+        with self.lock:
+            snapshot = {key: list(series) for key, series in self.series.items()}
+        result = {}
+        for key, series in snapshot.items():
+            count = sum(series[:len(self.buckets) + 1])
+            result[format_labels(key) or "all"] = {
+                "count": count, "sum": round(series[-2], 6),
+                "mean": round(series[-2] / count, 6) if count else None,
+                "p50": self.quantile(series, 0.5), "p95": self.quantile(series, 0.95),
+                "p99": self.quantile(series, 0.99), "max": round(series[-1], 6)}
+        return result
+
+    def prometheus(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = {key: list(series) for key, series in self.series.items()}
+        for key, series in sorted(snapshot.items()):
+            running = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:len(self.buckets) + 1]):
+                running += count
+                lines.append(f"{self.name}_bucket{format_labels(key, [('le', bound)])} {running}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{format_labels(key)} {running}")
+        return lines
+
+class Counter:
+    """Monotonic counter (per label set)."""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def summary(self):
+        with self.lock:
+            return {format_labels(key) or "all": value for key, value in self.values.items()}
+
+    def prometheus(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            lines.extend(f"{self.name}{format_labels(key)} {value}" for key, value in sorted(self.values.items()))
+        return lines
+
+class Gauge:
+    """Value read from a callback at export time (queue depths, memory, limits)."""
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help = help_text
+        self.read = read
+
+    def value(self):
+        try:
+            return self.read()
+        except Exception:
+            return None
+
+    def summary(self):
+        return self.value()
+
+    def prometheus(self):
+        value = self.value()
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if value is not None:
+            lines.append(f"{self.name} {float(value)}")
+        return lines
+
+# -------------------- Registry --------------------
+
+class Registry:
+    """Named metrics of one scraper run, exported as Prometheus text or a JSON summary."""
+
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.stage_seconds = self.histogram("stage_seconds", "Time spent per scraper stage")
+
+    def register(self, short_name, kind, factory):
+        """Return the metric called `short_name`, creating it on first use.
+
+        Raises ValueError if the name is already taken by a metric of another type."""
+        with self.lock:
+            metric = self.metrics.get(short_name)
+            if metric is None:
+                metric = self.metrics[short_name] = factory(f"{self.prefix}_{short_name}")
+            elif not isinstance(metric, kind):
+                raise ValueError(f"Metric {short_name!r} is already registered as a {type(metric).__name__}")
+            return metric
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self.register(name, Histogram, lambda full: Histogram(full, help_text, buckets))
+
+    def counter(self, name, help_text=""):
+        return self.register(name, Counter, lambda full: Counter(full, help_text or name.replace("_", " ")))
+
+    def gauge(self, name, help_text, read):
+        """Register a gauge; registering it again (e.g. for a new run) replaces its callback."""
+        gauge = self.register(name, Gauge, lambda full: Gauge(full, help_text, read))
+        gauge.read = read
+        return gauge
+
+    def inc(self, name, amount=1, **labels):
+        self.counter(name).inc(amount, **labels)
+
+    def observe(self, stage, seconds):
+        self.stage_seconds.observe(seconds, stage=stage)
+
+    @contextmanager
+    def timer(self, stage):
+        """Time a block into the stage histogram."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - started, stage=stage)
+
+    def prometheus(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.prometheus())
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+        elapsed = time.time() - self.started_at
+        summary = {"started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+                   "elapsed_s": round(elapsed, 3)}
+        for name, metric in metrics.items():
+            summary[name] = metric.summary()
+        pages = sum(metrics["pages_total"].values.values()) if "pages_total" in metrics else 0
+        summary["pages_per_s"] = round(pages / elapsed, 3) if elapsed else None
+        return summary
+
+    def write_summary(self, path=SUMMARY_FILE):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        return path
+
+# -------------------- Profiling --------------------
+
+class SampledProfiler:
+    """Run cProfile on one in `every` calls (one call at a time) and accumulate the stats.
+
+    Profiling only a sample of calls keeps the overhead low and avoids
+    profiling several threads at once."""
+
+    def __init__(self, every=PROFILE_SAMPLE_EVERY):
+        self.every = every
+        self.calls = 0
+        self.samples = 0
+        self.stats = None
+        self.lock = threading.Lock()
+        self.busy = threading.Lock()
+
+    def call(self, func, *args, **kwargs):
+        with self.lock:
+            self.calls += 1
+            sample = self.calls % self.every == 1 or self.every == 1
+        if not sample or not self.busy.acquire(blocking=False):
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            try:
+                profile.enable()
+            except ValueError:  # Another profiler is active in this interpreter
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self.lock:
+                    self.samples += 1
+                    if self.stats is None:
+                        self.stats = pstats.Stats(profile)
+                    else:
+                        self.stats.add(profile)
+        finally:
+            self.busy.release()
+
+    def dump(self, path=PROFILE_FILE):
+        """Write the accumulated stats (readable with `python -m pstats`); None if nothing was sampled."""
+        with self.lock:
+            if self.stats is None:
+                return None
+            self.stats.dump_stats(path)
+        print(f"Parse profile ({self.samples} of {self.calls} calls sampled) saved to {path}")
+        return path
+
+# -------------------- Endpoint --------------------
+
+def start_server(registry, port, host="127.0.0.1"):
+    """Serve /metrics (Prometheus text) and /summary (JSON) from a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics"):
+                body, content_type = registry.prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+            elif self.path.startswith("/summary"):
+                body, content_type = json.dumps(registry.summary(), indent=2).encode("utf-8"), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+# Shared registry for the scraper process
+registry = Registry()
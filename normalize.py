@@ -0,0 +1,146 @@
+import re
+import json
+from datetime import datetime
+
+from storage import schedule_id, route_id_of
+
+# -------------------- Configuration --------------------
+SEARCH_DATE_FORMAT = "%d %b, %Y"   # journey_date format used by construct_search_url
+CURRENCY_SYMBOLS = {"฿": "THB", "$": "USD", "€": "EUR", "£": "GBP"}
+
+TIME_RE = re.compile(r'(\d{1,2})[:.](\d{2})\s*([AaPp][Mm])?')
+HOURS_RE = re.compile(r'(\d+)\s*H', re.IGNORECASE)
+MINUTES_RE = re.compile(r'(\d+)\s*M', re.IGNORECASE)
+AMOUNT_RE = re.compile(r'\d[\d,]*(?:\.\d+)?')
+CURRENCY_RE = re.compile(r'\b([A-Z]{3})\b')
+
+# -------------------- Field parsers --------------------
+
+def parse_price(text):
+    """Parse a display price like "THB 1,450" into (1450.0, "THB"); (None, None) if absent."""
+    if not text or text == "N/A":
+        return None, None
+    amount_match = AMOUNT_RE.search(text)
+    if not amount_match:
+        return None, None
+    amount = float(amount_match.group(0).replace(",", ""))
+    currency_match = CURRENCY_RE.search(text)
+    currency = currency_match.group(1) if currency_match else None
+    if currency is None:
+        currency = next((code for symbol, code in CURRENCY_SYMBOLS.items() if symbol in text), None)
+    return amount, currency
+
+def time_to_minutes(text):
+    """Convert "HH:MM" (or "h:MM AM/PM") to minutes after midnight; None if absent."""
+    if not text or text == "N/A":
+        return None
+    match = TIME_RE.search(text)
+    if not match:
+        return None
+    hours, minutes, meridiem = int(match.group(1)), int(match.group(2)), match.group(3)
+    if meridiem:
+        hours = hours % 12 + (12 if meridiem.lower() == "pm" else 0)
+    return hours * 60 + minutes
+
+def duration_to_minutes(text):
+    """Convert "2 Hr. 30 Min." (or "Layover 1 Hr. 0 Min.") to minutes; None if absent."""
+    if not text or text == "N/A":
+        return None
+    hours = HOURS_RE.search(text)
+    minutes = MINUTES_RE.search(text)
+    if not hours and not minutes:
+        return None
+    return (int(hours.group(1)) if hours else 0) * 60 + (int(minutes.group(1)) if minutes else 0)
+
+def to_float(value):
+    """Parse a coordinate string; None for "N/A", blanks and junk."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def to_iso_date(search_date):
+    """Convert the scraper's "12 Feb, 2025" search date to "2025-02-12" (unchanged if unparsable)."""
+    if not search_date:
+        return None
+    try:
+        return datetime.strptime(search_date, SEARCH_DATE_FORMAT).date().isoformat()
+    except ValueError:
+        return search_date
+
+def route_details_of(row):
+    route_details = row.get("route_details")
+    if isinstance(route_details, dict):
+        return route_details
+    try:
+        return json.loads(route_details or "{}")
+    except ValueError:
+        return {}
+
+# -------------------- Row normalization --------------------
+
+def normalize_schedule(row):
+    """Return the typed version of a scraped schedule row."""
+    price_adult, currency = parse_price(row.get("price_adult"))
+    price_child, child_currency = parse_price(row.get("price_child"))
+    departure_min = time_to_minutes(row.get("departure_time"))
+    arrival_min = time_to_minutes(row.get("arrival_time"))
+    duration_min = None
+    arrival_day_offset = None
+    if departure_min is not None and arrival_min is not None:
+        arrival_day_offset = 1 if arrival_min < departure_min else 0  # Overnight trips
+        duration_min = arrival_min + arrival_day_offset * 1440 - departure_min
+    information = row.get("information")
+    return {
+        "schedule_id": schedule_id(row),
+        "search_date": to_iso_date(row.get("search_date")),
+        "from_location": row.get("from_location"),
+        "to_location": row.get("to_location"),
+        "from_location_address": row.get("from_location_address"),
+        "to_location_address": row.get("to_location_address"),
+        "departure_min": departure_min,
+        "arrival_min": arrival_min,
+        "arrival_day_offset": arrival_day_offset,
+        "duration_min": duration_min,
+        "price_adult": price_adult,
+        "price_child": price_child,
+        "currency": currency or child_currency,
+        "operator": row.get("operator"),
+        "vessel": row.get("vessel"),
+        "route_id": route_id_of(row),
+        "from_lat": to_float(row.get("from_lat")),
+        "from_lon": to_float(row.get("from_lon")),
+        "to_lat": to_float(row.get("to_lat")),
+        "to_lon": to_float(row.get("to_lon")),
+        "cancellation_policy": row.get("cancellation_policy"),
+        "information": information if isinstance(information, str) and information else None,
+    }
+
+def normalize_segments(row, sid=None):
+    """Return the typed route segments of a schedule row, in travel order."""
+    sid = sid or schedule_id(row)
+    segments = []
+    for seq, segment in enumerate(route_details_of(row).get("segments", [])):
+        seg_from = segment.get("from") or {}
+        seg_to = segment.get("to") or {}
+        layover_min = duration_to_minutes(segment.get("layover"))
+        # Only the first leg has a departure time; later legs leave after the layover.
+        departure_min = time_to_minutes(seg_from.get("departure_time"))
+        if departure_min is None:
+            arrived = time_to_minutes(seg_from.get("arrival_time"))
+            if arrived is not None:
+                departure_min = (arrived + (layover_min or 0)) % 1440
+        segments.append({
+            "schedule_id": sid,
+            "seq": seq,
+            "from_location": seg_from.get("location"),
+            "to_location": seg_to.get("location"),
+            "from_address": seg_from.get("address"),
+            "to_address": seg_to.get("address"),
+            "transport": " + ".join(segment.get("transport") or []) or None,
+            "departure_min": departure_min,
+            "arrival_min": time_to_minutes(seg_to.get("arrival_time")),
+            "duration_min": duration_to_minutes(segment.get("duration")),
+            "layover_min": layover_min,
+        })
+    return segments
@@ -0,0 +1,97 @@
+import re
+import hashlib
+import threading
+import urllib.parse
+from collections import OrderedDict
+from datetime import datetime
+
+from metrics import registry
+
+# -------------------- Configuration --------------------
+PARSE_CACHE_SIZE = 1024      # Distinct result pages kept (least recently used ones are dropped)
+SEARCH_DATE_FORMAT = "%d %b, %Y"
+# Other spellings of the search date a page may contain (form values, links, headings)
+DATE_VARIANTS = ("%d %b, %Y", "%d %B, %Y", "%d %b %Y", "%d %B %Y", "%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y")
+
+# Markup that changes between requests without changing the results. Each pattern starts
+# with a literal character so the scan stays fast on large pages.
+VOLATILE_MARKUP_RE = re.compile(
+    r"<(?:script\b.*?</script>"                               # inline data, analytics, fromCityList
+    r"|!--.*?-->"
+    r"|input\b[^>]*\btype=[\"']?hidden\b[^>]*>"              # form/session state
+    r"|meta\b[^>]*\bname=[\"']?csrf[^>]*>)",
+    re.S | re.I)
+VOLATILE_ATTR_RE = re.compile(r" (?:nonce|data-token|data-csrf)=[\"'][^\"']*[\"']", re.I)
+# Session and cache-busting query parameters in links, e.g. ?_token=... or ?v=1712345
+VOLATILE_PARAM_RE = re.compile(r"([?&](?:_token|token|csrf|sid|session_?id|phpsessid|v|_)=)[^&\"'\s>]*", re.I)
+
+def date_spellings(search_date):
+    """The search date as it may appear in a page: display, ISO and URL-encoded forms."""
+    spellings = {search_date}
+    try:
+        day = datetime.strptime(search_date, SEARCH_DATE_FORMAT)
+    except (TypeError, ValueError):
+        day = None
+    if day is not None:
+        for fmt in DATE_VARIANTS:
+            text = day.strftime(fmt)
+            spellings.update((text, text.lstrip("0")))
+    for text in list(spellings):
+        spellings.update((urllib.parse.quote_plus(text), urllib.parse.quote(text)))
+    return sorted((text for text in spellings if text), key=len, reverse=True)
+
+def markup_key(html, search_date=None):
+    """Hash of a search page with its search date, scripts, tokens and comments stripped."""
+    text = VOLATILE_MARKUP_RE.sub("", html)
+    text = VOLATILE_ATTR_RE.sub("", text)
+    text = VOLATILE_PARAM_RE.sub(r"\1", text)
+    if search_date:
+        text = re.sub("|".join(map(re.escape, date_spellings(search_date))), "", text)
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+class ParseCache:
+    """Bounded LRU of parsed search results keyed by `markup_key`.
+
+    Routes often return the same timetable for every day of a sweep; a hit
+    reuses the rows extracted before and only restamps `search_date`."""
+
+    def __init__(self, max_entries=PARSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, search_date=None):
+        """Rows cached for `key` stamped with `search_date`, or None."""
+        with self.lock:
+            rows = self.entries.get(key)
+            if rows is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        registry.inc("parse_cache_total", result="miss" if rows is None else "hit")
+        if rows is None:
+            return None
+        return [dict(row, search_date=search_date) for row in rows]
+
+    def put(self, key, schedules):
+        rows = tuple(dict(row) for row in schedules)  # Callers may change the rows they got back
+        with self.lock:
+            self.entries[key] = rows
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def parse(self, html, search_date, parse):
+        """Return `parse(html, search_date)`, from the cache when an equivalent page was parsed before."""
+        key = markup_key(html, search_date)
+        schedules = self.get(key, search_date)
+        if schedules is None:
+            schedules = parse(html, search_date)
+            self.put(key, schedules)
+        return schedules
+
+    def __len__(self):
+        return len(self.entries)
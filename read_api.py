@@ -0,0 +1,301 @@
+import os
+import csv
+import json
+import sqlite3
+import argparse
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from urllib.request import pathname2url
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from storage import schedule_id
+from normalize import to_iso_date, SEARCH_DATE_FORMAT
+
+# -------------------- Configuration --------------------
+HOST = "127.0.0.1"
+PORT = 8080
+SCHEDULES_FILE = "ferry_schedules_final_final.csv"  # CSV, sqlite or typed-sqlite output
+VALID_ROUTES_FILE = "valid_routes.json"
+VALID_ROUTES_STATE_FILE = "valid_routes_state.json"  # Locations of the last route discovery (fallback)
+LOCATIONS_CACHE_FILE = "locations_cache.json"        # The scraper's cached fromCityList
+CACHE_SIZE = 512       # Cached responses
+CACHE_TTL = 300        # Seconds a cached response may be served
+CSV_RELOAD_SECONDS = 10  # The CSV is re-read at most this often while the scraper keeps appending to it
+
+csv.field_size_limit(16 * 1024 * 1024)
+
+def file_signature(path):
+    """Cheap change marker for a file: (mtime_ns, size), or None if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+def display_date(iso_date):
+    """"2025-02-12" -> "12 Feb, 2025", the search_date format the scraper stores."""
+    return datetime.strptime(iso_date, "%Y-%m-%d").strftime(SEARCH_DATE_FORMAT)
+
+# -------------------- Stores --------------------
+
+class CsvScheduleStore:
+    """In-memory (from, to, ISO date) index over the CSV output.
+
+    The index is rebuilt when the file changes, but at most every `reload_seconds`:
+    during a scrape the writer appends to the file on every flush."""
+
+    def __init__(self, path, reload_seconds=CSV_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.lock = threading.Lock()
+        self.loaded_signature = None
+        self.loaded_at = None
+        self.index = {}
+
+    def generation(self):
+        """Signature of the file version the index was built from (after a due reload)."""
+        self.refresh()
+        return self.loaded_signature
+
+    def refresh(self):
+        signature = file_signature(self.path)
+        with self.lock:
+            if signature == self.loaded_signature:
+                return
+            if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.reload_seconds:
+                return  # Serve the current index a little longer
+            self.loaded_at = time.monotonic()
+            latest = {}
+            if signature is not None:
+                with open(self.path, "r", newline="", encoding="utf-8") as f:
+                    for row in csv.DictReader(f):
+                        latest[schedule_id(row)] = row  # Rows appended later are newer versions
+            index = {}
+            for row in latest.values():
+                key = (row.get("from_location", "").strip(), row.get("to_location", "").strip(),
+                       to_iso_date(row.get("search_date")))
+                index.setdefault(key, []).append(row)
+            for rows in index.values():
+                rows.sort(key=lambda row: row.get("departure_time") or "")
+            self.index = index
+            self.loaded_signature = signature
+
+    def schedules(self, from_location, to_location, iso_date):
+        self.refresh()
+        return self.index.get((from_location, to_location, iso_date), [])
+
+    def close(self):
+        pass
+
+class SqliteScheduleStore:
+    """Queries the sqlite / typed-sqlite output through its (from, to, search_date) index."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Schedules database not found: {path}")
+        # Read-only, so the API never creates or changes the scraper's database.
+        self.conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?mode=ro", uri=True,
+                                    check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(schedules)")}
+        self.iso_dates = "departure_time" not in columns  # typed-sqlite stores ISO dates and minutes
+        self.order_by = "departure_min" if self.iso_dates else "departure_time"
+
+    def generation(self):
+        # data_version changes whenever another connection (the scraper's writer) commits.
+        with self.lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def schedules(self, from_location, to_location, iso_date):
+        search_date = iso_date if self.iso_dates else display_date(iso_date)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT * FROM schedules WHERE from_location = ? AND to_location = ? AND search_date = ? "
+                f"ORDER BY {self.order_by}", (from_location, to_location, search_date)).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        self.conn.close()
+
+def open_store(path):
+    if os.path.isdir(path):
+        raise ValueError(f"Unsupported schedules output (parquet datasets are not served): {path}")
+    if path.endswith((".sqlite3", ".db")):
+        return SqliteScheduleStore(path)
+    return CsvScheduleStore(path)
+
+# -------------------- Cache --------------------
+
+class ResponseCache:
+    """LRU cache of encoded responses with a TTL.
+
+    Each entry remembers the data generation it was built from; an entry from
+    an older generation is treated as a miss, so a writer commit invalidates
+    everything without scanning the cache."""
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (generation, expires_at, body)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, generation):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == generation and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, generation, body):
+        with self.lock:
+            self.entries[key] = (generation, time.monotonic() + self.ttl, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+# -------------------- API --------------------
+
+class ReadAPI:
+    """Serves schedules by route and date, the location list and the valid-routes map.
+
+    The data generation combines the store's own change marker, the route
+    files' signatures and a local counter bumped by `invalidate` (hooked to
+    the scraper's BatchWriter when running in-process)."""
+
+    def __init__(self, schedules_file=SCHEDULES_FILE, valid_routes_file=VALID_ROUTES_FILE,
+                 state_file=VALID_ROUTES_STATE_FILE, cache=None, locations_file=LOCATIONS_CACHE_FILE):
+        self.store = open_store(schedules_file)
+        self.valid_routes_file = valid_routes_file
+        self.state_file = state_file
+        self.locations_file = locations_file
+        self.cache = cache or ResponseCache()
+        self.commits = 0
+
+    def attach(self, writer):
+        """Invalidate cached responses whenever a BatchWriter commits a batch."""
+        writer.on_flush.append(self.invalidate)
+
+    def invalidate(self, rows=None):
+        self.commits += 1
+        self.cache.clear()
+
+    def generation(self):
+        return (self.commits, self.store.generation(), file_signature(self.valid_routes_file),
+                file_signature(self.state_file), file_signature(self.locations_file))
+
+    def read_json_file(self, path, default):
+        if not os.path.exists(path):
+            return default
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def locations(self):
+        """The location list from the scraper's locations cache, else from the route state."""
+        locations = self.read_json_file(self.locations_file, {}).get("locations")
+        if locations:
+            return locations
+        return self.read_json_file(self.state_file, {}).get("locations", [])
+
+    def valid_routes(self):
+        return self.read_json_file(self.valid_routes_file, {})
+
+    def schedules(self, params):
+        from_location, to_location, journey_date = (params.get(name, [""])[0].strip()
+                                                    for name in ("from", "to", "date"))
+        if not (from_location and to_location and journey_date):
+            raise ValueError("from, to and date are required")
+        iso_date = to_iso_date(journey_date)
+        display_date(iso_date)  # Rejects dates in neither format
+        return self.store.schedules(from_location, to_location, iso_date)
+
+    def handle(self, path, params):
+        """Return (status, body bytes, cache status) for a GET request."""
+        routes = {"/schedules": lambda: self.schedules(params), "/locations": self.locations,
+                  "/valid-routes": self.valid_routes}
+        if path == "/health":
+            return 200, json.dumps({"status": "ok", "cache": self.cache.stats()}).encode("utf-8"), "BYPASS"
+        if path not in routes:
+            return 404, b'{"error": "not found"}', "BYPASS"
+        key = (path, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+        generation = self.generation()
+        body = self.cache.get(key, generation)
+        if body is not None:
+            return 200, body, "HIT"
+        try:
+            body = json.dumps(routes[path](), ensure_ascii=False).encode("utf-8")
+        except ValueError as e:
+            return 400, json.dumps({"error": str(e)}).encode("utf-8"), "BYPASS"
+        self.cache.put(key, generation, body)
+        return 200, body, "MISS"
+
+    def close(self):
+        self.store.close()
+
+class RequestHandler(BaseHTTPRequestHandler):
+    api = None  # Set by make_server
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            status, body, cache_status = self.api.handle(url.path.rstrip("/") or "/", parse_qs(url.query))
+        except Exception as e:
+            print(f"Error serving {self.path}: {e}")
+            status, body, cache_status = 500, b'{"error": "internal error"}', "BYPASS"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Cache", cache_status)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep the scraper's console output readable
+
+def make_server(api, host=HOST, port=PORT):
+    handler = type("ReadAPIHandler", (RequestHandler,), {"api": api})
+    return ThreadingHTTPServer((host, port), handler)
+
+def start_in_background(api, host=HOST, port=PORT):
+    """Serve `api` from a daemon thread (e.g. next to a running scrape); returns the server."""
+    server = make_server(api, host, port)
+    threading.Thread(target=server.serve_forever, name="read-api", daemon=True).start()
+    print(f"Read API listening on http://{host}:{server.server_address[1]}")
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local read API over the scraped schedules.")
+    parser.add_argument("--schedules", default=SCHEDULES_FILE, help="CSV, sqlite or typed-sqlite output")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+
+    api = ReadAPI(args.schedules)
+    server = make_server(api, args.host, args.port)
+    print(f"Read API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        api.close()
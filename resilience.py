@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from metrics import registry
+
+# -------------------- Configuration --------------------
+RETRY_ATTEMPTS = 3           # Attempts per call for retry_call (the job ledger has its own MAX_ATTEMPTS)
+RETRY_BASE_DELAY = 2.0       # Seconds; doubled per attempt, with full jitter
+RETRY_MAX_DELAY = 120.0
+AIMD_INCREASE_EVERY = 10     # Healthy responses needed to add one concurrent request
+AIMD_DECREASE_FACTOR = 0.5   # Concurrency multiplier after a timeout or 429/5xx
+AIMD_COOLDOWN = 5.0          # Seconds after a cut during which further overload signals are ignored
+BREAKER_FAILURE_THRESHOLD = 8   # Consecutive transient failures that open the circuit
+BREAKER_OPEN_SECONDS = 60.0     # How long the sweep pauses before a probe request
+DEAD_LETTER_FILE = "dead_letters.jsonl"
+
+OVERLOAD_STATUSES = {429, 502, 503, 504}
+TIMEOUT_ERRORS = {"TimeoutError", "TimeoutException", "Timeout", "ReadTimeout", "ConnectTimeout",
+                  "ServerTimeoutError"}
+CONNECTION_ERRORS = {"ConnectionError", "ClientConnectionError", "ClientOSError", "ServerDisconnectedError",
+                     "ChunkedEncodingError", "WebDriverException"}
+
+# -------------------- Error classification --------------------
+
+def status_of(error):
+    """HTTP status of a requests/aiohttp error, if any."""
+    status = getattr(error, "status", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+def classify(error):
+    """Sort a failure into "throttled", "server", "timeout", "connection" or "other"."""
+    status = status_of(error)
+    if status == 429:
+        return "throttled"
+    if status is not None and status >= 500:
+        return "server"
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if names & TIMEOUT_ERRORS:
+        return "timeout"
+    if names & CONNECTION_ERRORS:
+        return "connection"
+    return "other"
+
+def is_overload(error):
+    """Errors that mean the site is struggling: timeouts, 429 and 502/503/504 responses."""
+    kind = classify(error)
+    return kind in ("throttled", "timeout") or (kind == "server" and status_of(error) in OVERLOAD_STATUSES)
+
+def is_transient(error):
+    """Errors worth retrying and counting towards the circuit breaker."""
+    return classify(error) != "other"
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """Exponential backoff with full jitter for the given (1-based) attempt."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+# -------------------- AIMD concurrency --------------------
+
+class AIMDController:
+    """Additive-increase / multiplicative-decrease concurrency limit.
+
+    Every `increase_every` healthy responses raise the limit by one (up to
+    `maximum`); a timeout or 429/5xx cuts it by `decrease_factor` (down to
+    `minimum`), at most once per `cooldown` so one burst of errors counts once.
+    Thread workers hold a `slot()` while they fetch."""
+
+    def __init__(self, initial, minimum=1, maximum=None, increase_every=AIMD_INCREASE_EVERY,
+                 decrease_factor=AIMD_DECREASE_FACTOR, cooldown=AIMD_COOLDOWN):
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        self.limit = max(minimum, min(initial, self.maximum))
+        self.increase_every = increase_every
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.successes = 0
+        self.last_cut = 0.0
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def record_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.increase_every and self.limit < self.maximum:
+                self.successes = 0
+                self.limit += 1
+                self.condition.notify()
+
+    def record_overload(self):
+        with self.condition:
+            now = time.monotonic()
+            self.successes = 0
+            if now - self.last_cut < self.cooldown:
+                return
+            self.last_cut = now
+            new_limit = max(self.minimum, int(self.limit * self.decrease_factor))
+            if new_limit < self.limit:
+                print(f"Site is overloaded; reducing concurrency {self.limit} -> {new_limit}")
+                registry.inc("concurrency_cuts_total")
+                self.limit = new_limit
+
+    def record(self, error=None):
+        """Feed one outcome (None for success) into the controller."""
+        if error is None:
+            self.record_success()
+        elif is_overload(error):
+            self.record_overload()
+
+    @contextmanager
+    def slot(self):
+        """Block until fewer than `limit` requests are in flight, then hold a slot."""
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify()
+
+# -------------------- Circuit breaker --------------------
+
+class CircuitBreaker:
+    """Site-wide breaker: after `failure_threshold` consecutive transient failures
+    the circuit opens and callers pause for `open_seconds`. Then a single probe
+    is let through (half-open); its success closes the circuit, its failure
+    opens it again."""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, open_seconds=BREAKER_OPEN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self.opened_at >= self.open_seconds else "open"
+
+    def pause_remaining(self):
+        """Seconds to wait before making a request (0 when one may go ahead now).
+
+        While half-open, only the caller that gets 0 first becomes the probe."""
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            remaining = self.opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self.probing:
+                return 1.0
+            self.probing = True
+            return 0.0
+
+    def wait(self):
+        """Block while the circuit is open (thread workers)."""
+        while (remaining := self.pause_remaining()) > 0:
+            time.sleep(min(remaining, 5.0))
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                print("Site recovered; closing circuit breaker")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self, error):
+        if not is_transient(error):
+            self.record_success()  # The site answered; the failure is ours (e.g. a parse error)
+            return
+        with self.lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                print(f"Circuit breaker open after {self.failures} failures; pausing requests for "
+                      f"{self.open_seconds:.0f}s ({error})")
+                self.opened_at = time.monotonic()
+                self.probing = False
+                registry.inc("circuit_opened_total")
+
+    def record(self, error=None):
+        if error is None:
+            self.record_success()
+        else:
+            self.record_failure(error)
+
+# -------------------- Request budget --------------------
+
+class BudgetExhausted(Exception):
+    """Raised instead of making a request once the request budget is spent."""
+
+class RequestBudget:
+    """Thread-safe count of the HTTP requests (retries included) a scheduler cycle may still make."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def charge(self):
+        """Count one request, or raise BudgetExhausted when none is left."""
+        with self.lock:
+            if self.used >= self.limit:
+                raise BudgetExhausted(f"request budget of {self.limit} spent")
+            self.used += 1
+
+    @property
+    def remaining(self):
+        with self.lock:
+            return self.limit - self.used
+
+# -------------------- Retries --------------------
+
+class DeadLetters:
+    """Append-only JSONL list of requests that kept failing after all their retries."""
+
+    def __init__(self, path=DEAD_LETTER_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def add(self, kind, task, error, attempts, **extra):
+        """Record a failed task; `extra` fields (e.g. the rows of a failed write) are stored with it."""
+        record = {"kind": kind, "task": list(task), "attempts": attempts, "error": str(error)[:1000],
+                  "error_class": classify(error), "failed_at": datetime.now().isoformat(timespec="seconds"),
+                  **extra}
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.count += 1
+        registry.inc("dead_letters_total", kind=kind)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+def retry_call(func, *args, attempts=RETRY_ATTEMPTS, breaker=None, controller=None, **kwargs):
+    """Call `func`, retrying transient failures with backoff; re-raises the last error.
+
+    The breaker (if any) is waited on before every attempt and both the
+    breaker and the AIMD controller are fed with each outcome."""
+    for attempt in range(1, attempts + 1):
+        if breaker is not None:
+            breaker.wait()
+        try:
+            result = func(*args, **kwargs)
+        except BudgetExhausted:
+            raise  # No request was made; nothing to tell the breaker or the controller
+        except Exception as e:
+            if breaker is not None:
+                breaker.record_failure(e)
+            if controller is not None:
+                controller.record(e)
+            if attempt == attempts or not is_transient(e):
+                raise
+            registry.inc("retries_total")
+            time.sleep(backoff_delay(attempt))
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        if controller is not None:
+            controller.record_success()
+        return result
@@ -0,0 +1,96 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import ferry_scraper
+from ferry_scraper import fetch_route, store_route, record_task_failure, claim_next_task, parse_results
+from metrics import registry
+from parse_cache import markup_key
+
+# -------------------- Configuration --------------------
+FETCH_WORKERS = None         # Fetch threads (None: ferry_scraper.MAX_CONCURRENCY)
+PARSE_WORKERS = None         # Parser processes (None: one per CPU core)
+HTML_QUEUE_SIZE = 32         # Fetched pages waiting for a parser; fetchers block when it is full
+PARSE_POLL_SECONDS = 0.5     # How often idle fetchers check for retries while pages are still being parsed
+
+def fetch_stage(ledger, pages):
+    """Fetch thread: claim tasks, download their pages and queue the HTML for parsing.
+
+    With no task left to claim, the thread keeps polling until every queued page
+    is parsed, since a page that fails to parse comes back as a retry."""
+    while True:
+        task = claim_next_task(ledger)
+        if task is None:
+            if pages.unfinished_tasks == 0:
+                return
+            time.sleep(PARSE_POLL_SECONDS)
+            continue
+        try:
+            with ferry_scraper.concurrency.slot():
+                html = fetch_route(task)
+        except Exception as e:
+            record_task_failure(ledger, task, e)
+            continue
+        ferry_scraper.site_breaker.record_success()
+        ferry_scraper.concurrency.record_success()
+        with registry.timer("parse_queue_wait"):  # Backpressure from the parse stage
+            pages.put((task, html))
+
+def parse_stage(ledger, pages, executor, totals):
+    """Parse feeder thread: send queued pages to the process pool and hand the rows to the writer."""
+    count_total = 0
+    while (item := pages.get()) is not None:
+        task, html = item
+        try:
+            with registry.timer("parse"):
+                # Identical pages are answered from the cache without a round trip to the pool.
+                key = markup_key(html, task[2]) if ferry_scraper.PARSE_CACHE else None
+                schedules = ferry_scraper.parse_cache.get(key, task[2]) if key else None
+                if schedules is None:
+                    schedules = executor.submit(parse_results, html, task[2]).result()
+                    if key:
+                        ferry_scraper.parse_cache.put(key, schedules)
+            count = store_route(task, schedules)
+        except Exception as e:
+            record_task_failure(ledger, task, e)
+        else:
+            ledger.mark_done(task, count)
+            count_total += count
+        finally:
+            pages.task_done()  # Only after the ledger is updated, so idle fetchers see the retry
+    totals.append(count_total)
+
+def run_staged(ledger, fetch_workers=None, parse_workers=None, queue_size=HTML_QUEUE_SIZE):
+    """Scrape the ledger's tasks as a three-stage pipeline; returns the schedules saved.
+
+    Fetch threads (I/O bound) put raw HTML on a bounded queue, a process pool
+    parses it off the GIL, and feeder threads pass the rows to the writer
+    stage (whose queue is bounded too). A full queue blocks the stage before
+    it, so fetching never runs far ahead of parsing and writing."""
+    fetch_workers = fetch_workers or FETCH_WORKERS or ferry_scraper.MAX_CONCURRENCY
+    parse_workers = parse_workers or PARSE_WORKERS or os.cpu_count() or 2
+    pages = queue.Queue(maxsize=queue_size)
+    registry.gauge("html_queue_depth", "Fetched pages waiting for a parser", pages.qsize)
+    totals = []
+    # Spawned (not forked) workers: the parent already runs writer, fetch and metrics threads.
+    context = multiprocessing.get_context("spawn")
+    print(f"Staged pipeline: {fetch_workers} fetch threads, {parse_workers} parser processes, "
+          f"queue of {queue_size} pages")
+    with ProcessPoolExecutor(max_workers=parse_workers, mp_context=context) as executor:
+        # Two feeders per process keep every parser busy while results are being stored.
+        parsers = [threading.Thread(target=parse_stage, args=(ledger, pages, executor, totals),
+                                    name=f"parse-feeder-{i}") for i in range(parse_workers * 2)]
+        fetchers = [threading.Thread(target=fetch_stage, args=(ledger, pages), name=f"fetch-{i}")
+                    for i in range(fetch_workers)]
+        for thread in parsers + fetchers:
+            thread.start()
+        for thread in fetchers:
+            thread.join()
+        for _ in parsers:
+            pages.put(None)
+        for thread in parsers:
+            thread.join()
+    return sum(totals)
@@ -0,0 +1,137 @@
+import os
+import re
+import json
+import difflib
+from collections import defaultdict
+
+# -------------------- Configuration --------------------
+VALID_ROUTES_FILE = "valid_routes.json"
+FUZZY_CUTOFF = 0.85  # Minimum difflib ratio for a fuzzy match within a block
+
+# Names that neither the scraper nor the "City (Pier)" pattern can tie together.
+STATION_ALIASES = {
+    "pinklao": "Bangkok",
+    "nakhon si thammarat": "Nakhon Si Thamarat",
+    "nakhon si thammarat airport": "Nakhon Si Thamarat Airport (NST)",
+    "surat thani airport": "Surat Thani Airport (URT)",
+}
+
+PAREN_RE = re.compile(r'\s*\(([^)]*)\)\s*')
+NON_WORD_RE = re.compile(r'[^\w\s]+')
+SPACE_RE = re.compile(r'\s+')
+
+# -------------------- Normalization --------------------
+
+def normalize_name(name):
+    """Case-fold and strip punctuation/extra spaces: "Koh Samui  (Bangrak/ Petcherat Pier)" ->
+    "koh samui bangrak petcherat pier"."""
+    if not isinstance(name, str):
+        return ""
+    name = NON_WORD_RE.sub(" ", name.replace("/", " ").casefold())
+    return SPACE_RE.sub(" ", name).strip()
+
+def split_pier(name):
+    """Split "Koh Phangan (Thongsala Pier)" into ("Koh Phangan", "Thongsala Pier"); pier is None without parentheses."""
+    if not isinstance(name, str):
+        return "", None
+    match = PAREN_RE.search(name)
+    if not match:
+        return name.strip(), None
+    return PAREN_RE.sub(" ", name).strip(), match.group(1).strip()
+
+def station_id(normalized):
+    """Canonical station ID (a slug) for a normalized name."""
+    return normalized.replace(" ", "-")
+
+# -------------------- Index --------------------
+
+class StationIndex:
+    """Alias index mapping any station spelling to a canonical station ID.
+
+    Built once from the scraper's canonical location names. Resolution order:
+    exact normalized alias, the name without its "(Pier)" part, the pier itself
+    (pier-to-city mapping), then a fuzzy match restricted to candidates that
+    share the first token. Unresolved names get their own ID so identical
+    unknown names still join. Results are cached per distinct name."""
+
+    def __init__(self, canonical_names, aliases=STATION_ALIASES, fuzzy_cutoff=FUZZY_CUTOFF):
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.aliases = {}                # normalized alias -> station_id
+        self.names = {}                  # station_id -> display name
+        self.blocks = defaultdict(list)  # first token -> [(normalized name, station_id)]
+        self.cache = {}
+        for name in canonical_names:
+            self.add_station(name)
+        for alias, target in aliases.items():
+            target_id = self.aliases.get(normalize_name(target))
+            if target_id:
+                self.aliases.setdefault(normalize_name(alias), target_id)
+
+    def add_station(self, name):
+        normalized = normalize_name(name)
+        if not normalized or normalized in self.aliases:
+            return
+        sid = station_id(normalized)
+        self.aliases[normalized] = sid
+        self.names.setdefault(sid, name.strip())
+        self.blocks[normalized.split()[0]].append((normalized, sid))
+
+    def add_pier_aliases(self, names):
+        """Learn pier -> city aliases from names like "Koh Phangan (Thongsala Pier)".
+
+        Generic qualifiers such as "(City)" or "(Bus Terminal)" only alias the full name."""
+        for name in names:
+            city, pier = split_pier(name)
+            if pier:
+                city_id = self.aliases.get(normalize_name(city))
+                if city_id:
+                    self.aliases.setdefault(normalize_name(name), city_id)
+                    if "pier" in normalize_name(pier).split():
+                        self.aliases.setdefault(normalize_name(pier), city_id)
+
+    def fuzzy_match(self, normalized):
+        if not normalized:
+            return None  # e.g. the city part of "(Thongsala Pier)"
+        candidates = self.blocks.get(normalized.split()[0], [])
+        best_id, best_ratio = None, self.fuzzy_cutoff
+        for candidate, sid in candidates:
+            ratio = difflib.SequenceMatcher(None, normalized, candidate).ratio()
+            if ratio >= best_ratio:
+                best_id, best_ratio = sid, ratio
+        return best_id
+
+    def resolve(self, name):
+        """Return the canonical station ID for a name ("" for empty names)."""
+        if name in self.cache:
+            return self.cache[name]
+        normalized = normalize_name(name)
+        sid = ""
+        if normalized:
+            city, pier = split_pier(name)
+            sid = (self.aliases.get(normalized)
+                   or self.aliases.get(normalize_name(city))
+                   or (pier and self.aliases.get(normalize_name(pier)))
+                   or self.fuzzy_match(normalize_name(city))
+                   or station_id(normalized))
+        self.cache[name] = sid
+        return sid
+
+    def resolve_series(self, series):
+        """Map a pandas Series of names to station IDs, resolving each distinct name once."""
+        mapping = {name: self.resolve(name) for name in series.dropna().unique()}
+        return series.map(mapping)
+
+def load_station_index(valid_routes_file=VALID_ROUTES_FILE, extra_names=(), alias_names=()):
+    """Build a StationIndex from the scraped locations in valid_routes.json plus `extra_names`,
+    learning pier aliases from `alias_names` (e.g. the timetable's station names)."""
+    names = []
+    if valid_routes_file and os.path.exists(valid_routes_file):
+        with open(valid_routes_file, "r", encoding="utf-8") as f:
+            valid_routes = json.load(f)
+        for from_loc, to_loc_list in valid_routes.items():
+            names.append(from_loc)
+            names.extend(to_loc_list)
+    names.extend(extra_names)
+    index = StationIndex(names)
+    index.add_pier_aliases(alias_names)
+    return index
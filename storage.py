@@ -0,0 +1,532 @@
+import os
+import csv
+import json
+import time
+import hashlib
+import functools
+import queue
+import sqlite3
+import threading
+
+from metrics import registry
+
+# -------------------- Configuration --------------------
+CSV_FIELDS = ['search_date', 'from_location', 'to_location', 'from_location_address', 'to_location_address',
+              'departure_time', 'arrival_time', 'price_adult', 'price_child', 'operator', 'vessel',
+              'cancellation_policy', 'route_details', 'information',
+              'from_lat', 'from_lon', 'to_lat', 'to_lon']
+
+# Long, highly repetitive text columns that are stored once in lookup tables
+# (field -> table) and referenced from schedule rows by a short ID.
+TEXT_TABLES = {
+    'cancellation_policy': 'policies',
+    'information': 'info',
+    'from_location_address': 'addresses',
+    'to_location_address': 'addresses',
+}
+DICT_CSV_FIELDS = [f"{field}_id" if field in TEXT_TABLES else field for field in CSV_FIELDS]
+
+# Identity of a schedule; re-scraping the same key updates the stored row instead of adding one.
+# `operator` is left out: wade.fill_supplier rewrites it, and route_id plus departure already
+# identify the sailing.
+KEY_FIELDS = ('search_date', 'from_location', 'to_location', 'departure_time', 'route_id')
+# Columns filled in after the scrape (wade.fill_supplier rewrites `operator`). They are not
+# hashed, and an update of an already stored schedule keeps their stored value, so a re-scrape
+# neither counts a filled row as changed nor blanks the filled value again.
+FILLED_FIELDS = ('operator',)
+
+BATCH_SIZE = 500         # Flush once this many rows are buffered ...
+FLUSH_INTERVAL = 2.0     # ... or when the oldest buffered row is this many seconds old
+QUEUE_MAXSIZE = 1000     # Batches of rows waiting for the writer (producers block when full)
+WRITE_ATTEMPTS = 3       # Tries per batch before it goes to the dead-letter list
+WRITE_RETRY_DELAY = 1.0  # Seconds before the first retry; doubled per attempt
+
+# -------------------- Row identity --------------------
+
+def route_id_of(row):
+    """Return the route_id stored in a row's `route_details` JSON ("N/A" when missing)."""
+    route_details = row.get('route_details')
+    if isinstance(route_details, dict):
+        return str(route_details.get('route_id', 'N/A'))
+    try:
+        return str(json.loads(route_details or '{}').get('route_id', 'N/A'))
+    except (ValueError, AttributeError):
+        return 'N/A'
+
+def cell(value):
+    """Normalize a value the way it round-trips through CSV, so hashes match across sinks."""
+    return "" if value is None else str(value)
+
+def schedule_key(row):
+    """Return the identity tuple of a schedule row (see KEY_FIELDS)."""
+    return tuple(route_id_of(row) if field == 'route_id' else cell(row.get(field)) for field in KEY_FIELDS)
+
+def schedule_id(row):
+    """Short stable ID derived from the schedule key."""
+    return hashlib.sha1("\x1f".join(schedule_key(row)).encode("utf-8")).hexdigest()[:16]
+
+def row_hash(row, fields=CSV_FIELDS):
+    """Content hash of a row's stored fields (without FILLED_FIELDS), used to skip unchanged rows."""
+    return hashlib.sha1("\x1f".join(cell(row.get(field)) for field in fields
+                                    if field not in FILLED_FIELDS).encode("utf-8")).hexdigest()
+
+def empty_stats():
+    return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+# -------------------- Text dictionaries --------------------
+
+def text_id(text):
+    """Short content-derived ID of a text value (None for empty values)."""
+    if not text:
+        return None
+    return hashlib.sha1(str(text).encode("utf-8")).hexdigest()[:12]
+
+class TextDictionary:
+    """Interns long text values into per-table {id: text} dictionaries.
+
+    `known` holds the IDs already persisted by a sink; new IDs collect in
+    `pending` until the sink stores them with `take_pending`."""
+
+    def __init__(self, tables=None):
+        tables = tables or sorted(set(TEXT_TABLES.values()))
+        self.known = {table: set() for table in tables}
+        self.pending = {table: {} for table in tables}
+
+    def intern(self, table, text):
+        tid = text_id(text)
+        if tid is not None and tid not in self.known[table]:
+            self.known[table].add(tid)
+            self.pending[table][tid] = str(text)
+        return tid
+
+    def intern_row(self, row):
+        """Return a copy of a row with its TEXT_TABLES fields replaced by `<field>_id` references."""
+        interned = dict(row)
+        for field, table in TEXT_TABLES.items():
+            interned[f"{field}_id"] = self.intern(table, interned.pop(field, None))
+        return interned
+
+    def take_pending(self):
+        pending = self.pending
+        self.pending = {table: {} for table in self.known}
+        return pending
+
+def existing_hashes(conn, table, ids):
+    """Return {schedule_id: row_hash} for the given IDs already stored in `table`."""
+    hashes = {}
+    ids = list(ids)
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        hashes.update(conn.execute(
+            f"SELECT schedule_id, row_hash FROM {table} WHERE schedule_id IN ({', '.join('?' for _ in chunk)})",
+            chunk))
+    return hashes
+
+# -------------------- Sinks --------------------
+
+class CsvSink:
+    """Idempotent CSV output keyed on the schedule identity.
+
+    New schedules are appended, unchanged ones are skipped. Changed ones are
+    appended too and the file is compacted on close (atomically, via a temp
+    file and rename) so each schedule appears once with its latest values.
+
+    With `intern_text`, the TEXT_TABLES columns are written as `<field>_id`
+    and their texts go once into `<base>_<table>.csv` (id, text) files."""
+
+    def __init__(self, path, fields=CSV_FIELDS, intern_text=False):
+        self.path = path
+        self.dictionary = None
+        if intern_text:
+            fields = DICT_CSV_FIELDS
+            self.dictionary = TextDictionary()
+            for table in self.dictionary.known:
+                if os.path.exists(self.dictionary_path(table)):
+                    with open(self.dictionary_path(table), mode='r', newline='', encoding='utf-8') as f:
+                        self.dictionary.known[table].update(row['id'] for row in csv.DictReader(f))
+        self.fields = fields
+        self.index = {}  # schedule_id -> row_hash of the latest stored version
+        self.needs_compaction = False
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, mode='r', newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    sid = schedule_id(row)
+                    if sid in self.index:
+                        self.needs_compaction = True  # Duplicates left by older append-only runs
+                    self.index[sid] = row_hash(row, fields)
+        self.file = open(path, mode='a', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=fields, extrasaction='ignore')
+        if self.file.tell() == 0:
+            self.writer.writeheader()
+
+    def dictionary_path(self, table):
+        base, _ = os.path.splitext(self.path)
+        return f"{base}_{table}.csv"
+
+    def write_dictionaries(self):
+        for table, entries in self.dictionary.take_pending().items():
+            if not entries:
+                continue
+            with open(self.dictionary_path(table), mode='a', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                if f.tell() == 0:
+                    writer.writerow(['id', 'text'])
+                writer.writerows(entries.items())
+
+    def write_rows(self, rows):
+        stats = empty_stats()
+        to_write = []
+        if self.dictionary is not None:
+            rows = [self.dictionary.intern_row(row) for row in rows]
+        for row in rows:
+            sid = schedule_id(row)
+            digest = row_hash(row, self.fields)
+            previous = self.index.get(sid)
+            if previous == digest:
+                stats["unchanged"] += 1
+                continue
+            if previous is None:
+                stats["inserted"] += 1
+            else:
+                stats["updated"] += 1
+                self.needs_compaction = True
+            self.index[sid] = digest
+            to_write.append(row)
+        if self.dictionary is not None:
+            self.write_dictionaries()  # Lookup entries first, so every written ID resolves
+        self.writer.writerows(to_write)
+        self.file.flush()
+        return stats
+
+    def compact(self):
+        """Rewrite the file keeping only the latest version of each schedule."""
+        latest = {}
+        with open(self.path, mode='r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                sid = schedule_id(row)
+                if sid in latest:  # Later lines are newer versions; filled columns stay as first stored
+                    row.update((field, latest[sid][field]) for field in FILLED_FIELDS if field in row)
+                latest[sid] = row
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, mode='w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.fields, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(latest.values())
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        self.file.close()
+        if self.needs_compaction:
+            self.compact()
+
+class SqliteSink:
+    """Upsert rows into an indexed SQLite `schedules` table keyed on the schedule identity."""
+
+    def __init__(self, path, fields=CSV_FIELDS):
+        self.path = path
+        self.fields = fields
+        # The writer thread is the only user of this connection.
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f"{field} TEXT" for field in fields)
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS schedules (
+                schedule_id TEXT PRIMARY KEY,
+                {columns},
+                route_id TEXT,
+                row_hash TEXT NOT NULL,
+                first_seen TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS schedules_route_date ON schedules (from_location, to_location, search_date);
+            CREATE INDEX IF NOT EXISTS schedules_date ON schedules (search_date);
+            CREATE INDEX IF NOT EXISTS schedules_operator ON schedules (operator);
+        """)
+        stored = ["schedule_id", *fields, "route_id", "row_hash", "first_seen", "updated_at"]
+        self.insert_sql = (f"INSERT INTO schedules ({', '.join(stored)}) "
+                           f"VALUES ({', '.join('?' for _ in stored)})")
+        self.update_fields = [field for field in fields if field not in FILLED_FIELDS]
+        assignments = ", ".join(f"{field} = ?" for field in self.update_fields)
+        self.update_sql = f"UPDATE schedules SET {assignments}, row_hash = ?, updated_at = ? WHERE schedule_id = ?"
+
+    def write_rows(self, rows):
+        stats = empty_stats()
+        by_id = {schedule_id(row): row for row in rows}  # Last version wins within a batch
+        existing = existing_hashes(self.conn, "schedules", by_id)
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+        inserts, updates = [], []
+        for sid, row in by_id.items():
+            digest = row_hash(row, self.fields)
+            if sid not in existing:
+                values = [None if row.get(field) is None else str(row.get(field)) for field in self.fields]
+                inserts.append((sid, *values, route_id_of(row), digest, now, now))
+            elif existing[sid] != digest:
+                values = [None if row.get(field) is None else str(row.get(field)) for field in self.update_fields]
+                updates.append((*values, digest, now, sid))
+            else:
+                stats["unchanged"] += 1
+        with self.conn:
+            self.conn.executemany(self.insert_sql, inserts)
+            self.conn.executemany(self.update_sql, updates)
+        stats["inserted"] += len(inserts)
+        stats["updated"] += len(updates)
+        stats["unchanged"] += len(rows) - len(by_id)
+        return stats
+
+    def close(self):
+        self.conn.close()
+
+TYPED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedules (
+    schedule_id           TEXT PRIMARY KEY,
+    search_date           TEXT,     -- ISO date
+    from_location         TEXT,
+    to_location           TEXT,
+    from_location_address_id TEXT,  -- addresses.id
+    to_location_address_id   TEXT,  -- addresses.id
+    departure_min         INTEGER,  -- minutes after midnight
+    arrival_min           INTEGER,
+    arrival_day_offset    INTEGER,  -- 1 when arriving the next day
+    duration_min          INTEGER,
+    price_adult           REAL,
+    price_child           REAL,
+    currency              TEXT,
+    operator              TEXT,
+    vessel                TEXT,
+    route_id              TEXT,
+    from_lat              REAL,
+    from_lon              REAL,
+    to_lat                REAL,
+    to_lon                REAL,
+    cancellation_policy_id TEXT,    -- policies.id
+    information_id        TEXT,     -- info.id
+    row_hash              TEXT NOT NULL,
+    updated_at            TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS schedules_route_date ON schedules (from_location, to_location, search_date);
+CREATE INDEX IF NOT EXISTS schedules_date_departure ON schedules (search_date, departure_min);
+CREATE TABLE IF NOT EXISTS route_segments (
+    schedule_id   TEXT NOT NULL,
+    seq           INTEGER NOT NULL,
+    from_location TEXT,
+    to_location   TEXT,
+    from_address_id TEXT,           -- addresses.id
+    to_address_id   TEXT,           -- addresses.id
+    transport     TEXT,
+    departure_min INTEGER,
+    arrival_min   INTEGER,
+    duration_min  INTEGER,
+    layover_min   INTEGER,
+    PRIMARY KEY (schedule_id, seq)
+);
+CREATE INDEX IF NOT EXISTS route_segments_from ON route_segments (from_location, to_location);
+CREATE TABLE IF NOT EXISTS policies (id TEXT PRIMARY KEY, text TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS info (id TEXT PRIMARY KEY, text TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS addresses (id TEXT PRIMARY KEY, text TEXT NOT NULL);
+"""
+
+class TypedSqliteSink:
+    """Typed output: numeric prices with currency, minute-of-day times, float
+    coordinates, and the route segments in their own `route_segments` table.
+    Policies, information blocks and addresses live once in the `policies`,
+    `info` and `addresses` tables and are referenced by ID."""
+
+    def __init__(self, path, fields=CSV_FIELDS):
+        import normalize  # normalize imports the row identity helpers from this module
+        self.normalize = normalize
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(TYPED_SCHEMA)
+        self.columns = [row[1] for row in self.conn.execute("PRAGMA table_info(schedules)")]
+        updated = [column for column in self.columns if column not in ("schedule_id", *FILLED_FIELDS)]
+        self.upsert_sql = (f"INSERT INTO schedules ({', '.join(self.columns)}) "
+                           f"VALUES ({', '.join('?' for _ in self.columns)}) "
+                           f"ON CONFLICT (schedule_id) DO UPDATE SET "
+                           f"{', '.join(f'{column} = excluded.{column}' for column in updated)}")
+        self.segment_columns = [row[1] for row in self.conn.execute("PRAGMA table_info(route_segments)")]
+        self.segment_sql = (f"INSERT INTO route_segments ({', '.join(self.segment_columns)}) "
+                            f"VALUES ({', '.join('?' for _ in self.segment_columns)})")
+        self.dictionary = TextDictionary()
+        for table in self.dictionary.known:
+            self.dictionary.known[table].update(tid for (tid,) in self.conn.execute(f"SELECT id FROM {table}"))
+
+    def write_rows(self, rows):
+        stats = empty_stats()
+        by_id = {schedule_id(row): row for row in rows}
+        existing = existing_hashes(self.conn, "schedules", by_id)
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+        schedules, segments, replaced = [], [], []
+        for sid, row in by_id.items():
+            digest = row_hash(row)
+            if existing.get(sid) == digest:
+                stats["unchanged"] += 1
+                continue
+            stats["updated" if sid in existing else "inserted"] += 1
+            if sid in existing:
+                replaced.append((sid,))
+            typed = self.dictionary.intern_row(self.normalize.normalize_schedule(row))
+            typed.update(row_hash=digest, updated_at=now)
+            schedules.append(tuple(typed.get(column) for column in self.columns))
+            for segment in self.normalize.normalize_segments(row, sid):
+                segment["from_address_id"] = self.dictionary.intern("addresses", segment.pop("from_address"))
+                segment["to_address_id"] = self.dictionary.intern("addresses", segment.pop("to_address"))
+                segments.append(tuple(segment[column] for column in self.segment_columns))
+        with self.conn:
+            for table, entries in self.dictionary.take_pending().items():
+                self.conn.executemany(f"INSERT OR IGNORE INTO {table} (id, text) VALUES (?, ?)", entries.items())
+            self.conn.executemany("DELETE FROM route_segments WHERE schedule_id = ?", replaced)
+            self.conn.executemany(self.upsert_sql, schedules)
+            self.conn.executemany(self.segment_sql, segments)
+        stats["unchanged"] += len(rows) - len(by_id)
+        return stats
+
+    def close(self):
+        self.conn.close()
+
+class ParquetSink:
+    """Write rows to a Parquet dataset directory: one file per run, one row group per flush."""
+
+    def __init__(self, path, fields=CSV_FIELDS):
+        try:  # Imported here so only runs that write Parquet need (and load) pyarrow
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("The Parquet sink requires pyarrow (pip install pyarrow)") from None
+        self.pa = pa
+        os.makedirs(path, exist_ok=True)
+        self.path = os.path.join(path, f"part-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.parquet")
+        self.fields = fields
+        self.schema = pa.schema([(field, pa.string()) for field in fields])
+        self.writer = pq.ParquetWriter(self.path, self.schema, compression="zstd")
+
+    def write_rows(self, rows):
+        columns = {field: [None if row.get(field) is None else str(row.get(field)) for row in rows]
+                   for field in self.fields}
+        self.writer.write_table(self.pa.table(columns, schema=self.schema))
+        stats = empty_stats()
+        stats["inserted"] = len(rows)  # Append-only: deduplicate when reading the dataset
+        return stats
+
+    def close(self):
+        self.writer.close()
+
+SINKS = {
+    "csv": CsvSink,
+    "sqlite": SqliteSink,
+    "typed-sqlite": TypedSqliteSink,
+    "csv-dict": functools.partial(CsvSink, intern_text=True),
+    "parquet": ParquetSink,
+}
+
+def make_sink(kind, path, **kwargs):
+    """Create a sink by name ("csv", "csv-dict", "sqlite", "typed-sqlite" or "parquet")."""
+    return SINKS[kind](path, **kwargs)
+
+# -------------------- Writer stage --------------------
+
+class BatchWriter:
+    """Background writer stage: producers `submit` rows, one thread batches and flushes them.
+
+    A flush happens when `batch_size` rows are buffered or `flush_interval`
+    seconds have passed since the first buffered row, so scraper threads never
+    touch the output file themselves. A batch the sink rejects is retried;
+    if it still fails, its rows are kept in `dead_letters` (when given)
+    instead of being dropped."""
+
+    def __init__(self, sink, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, maxsize=QUEUE_MAXSIZE,
+                 dead_letters=None, attempts=WRITE_ATTEMPTS):
+        self.sink = sink
+        self.dead_letters = dead_letters
+        self.attempts = attempts
+        self.rows_failed = 0
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.rows_written = 0
+        self.flushes = 0
+        self.stats = empty_stats()
+        self.on_flush = []  # Callbacks run after every committed batch
+        self.thread = threading.Thread(target=self.run, name="schedule-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, rows):
+        """Queue rows for writing (blocks only when the writer is far behind)."""
+        if rows:
+            self.queue.put(list(rows))
+
+    def write_batch(self, buffer):
+        """Write a batch, retrying with backoff; returns the sink's stats or raises the last error."""
+        for attempt in range(1, self.attempts + 1):
+            try:
+                with registry.timer("writer_flush"):
+                    return self.sink.write_rows(buffer) or {}
+            except Exception as e:
+                registry.inc("writer_errors_total")
+                if attempt == self.attempts:
+                    raise
+                print(f"Error writing {len(buffer)} rows (attempt {attempt}, will retry): {e}")
+                time.sleep(WRITE_RETRY_DELAY * 2 ** (attempt - 1))
+
+    def flush_buffer(self, buffer):
+        if not buffer:
+            return
+        try:
+            stats = self.write_batch(buffer)
+        except Exception as e:
+            self.rows_failed += len(buffer)
+            if self.dead_letters is not None:
+                print(f"Could not write {len(buffer)} rows: {e}; they were saved to {self.dead_letters.path}")
+                searches = sorted({(row.get("from_location"), row.get("to_location"), row.get("search_date"))
+                                   for row in buffer}, key=str)
+                self.dead_letters.add("write", searches, e, self.attempts,
+                                      rows=[{field: cell(row.get(field)) for field in CSV_FIELDS} for row in buffer])
+            else:
+                print(f"Could not write {len(buffer)} rows: {e}")
+            buffer.clear()
+            return
+        for name, count in stats.items():
+            self.stats[name] = self.stats.get(name, 0) + count
+        self.rows_written += len(buffer)
+        self.flushes += 1
+        for callback in self.on_flush:
+            try:
+                callback(buffer)
+            except Exception as e:
+                print(f"Error in writer callback: {e}")
+        buffer.clear()
+
+    def run(self):
+        buffer = []
+        first_buffered = None
+        while True:
+            timeout = None
+            if buffer:
+                timeout = max(0.0, first_buffered + self.flush_interval - time.monotonic())
+            try:
+                rows = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self.flush_buffer(buffer)
+                continue
+            if rows is None:  # Shutdown sentinel
+                self.flush_buffer(buffer)
+                return
+            if not buffer:
+                first_buffered = time.monotonic()
+            buffer.extend(rows)
+            if len(buffer) >= self.batch_size:
+                self.flush_buffer(buffer)
+
+    def close(self):
+        """Flush everything still queued, stop the thread and close the sink."""
+        self.queue.put(None)
+        self.thread.join()
+        self.sink.close()
+
+def output_path(kind, csv_filename):
+    """Default output path for a sink, derived from the CSV filename."""
+    base, _ = os.path.splitext(csv_filename)
+    return {"csv": csv_filename, "csv-dict": f"{base}_dict.csv", "sqlite": f"{base}.sqlite3", "typed-sqlite": f"{base}_typed.sqlite3",
+            "parquet": f"{base}_parquet"}[kind]
@@ -0,0 +1,16 @@
+"""Tests for station name resolution (run with `python -m pytest tests`)."""
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from stations import StationIndex  # noqa: E402
+
+def test_resolve_name_without_city():
+    """A name whose city part is empty resolves without fuzzy matching on an empty string."""
+    index = StationIndex(["Koh Phangan", "Koh Samui"])
+
+    assert index.fuzzy_match("") is None
+    assert index.resolve("(Thongsala Pier)") == "thongsala-pier"
+    assert index.resolve("") == ""
@@ -0,0 +1,29 @@
+"""Regression tests for wade.fill_supplier's chunk processing (run with `python -m pytest tests`)."""
+import io
+import os
+import sys
+
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import wade  # noqa: E402
+
+def read_chunk(text):
+    """Parse CSV text the way fill_supplier reads its chunks (blank cells are missing values)."""
+    return pd.read_csv(io.StringIO(text), dtype=str, keep_default_na=False, na_values=[""])
+
+def test_blank_information_chunk():
+    """A chunk whose information column is all blank must not abort fill_supplier."""
+    lookup_df = wade.read_timetable(os.path.join(REPO_DIR, "timetable.csv"))
+    station_index = wade.timetable_station_index(lookup_df, os.path.join(REPO_DIR, "valid_routes.json"))
+    supplier_lookup = wade.build_supplier_lookup(lookup_df, station_index)
+    row = lookup_df.iloc[0]
+    chunk = read_chunk(f"from_location,to_location,departure_time,information\n"
+                       f"\"{row['From']}\",\"{row['To']}\",{row['Departure']},\nKoh Tao,Bangkok,,\n")
+
+    filled = wade.fill_operator_chunk(chunk, supplier_lookup, station_index)
+
+    assert filled["operator"].iloc[0] == row["Supplier"]
+    assert pd.isna(filled["operator"].iloc[1])
@@ -1,81 +1,127 @@
+import os
+import tempfile
 import pandas as pd
 import numpy as np
 
-def fill_supplier(lookup_csv_path, target_csv_path):
+from stations import load_station_index, split_pier
+
+CHUNK_SIZE = 200_000  # Target rows processed per chunk
+
+# First words of 'information' that name an operator differently
+FIRST_WORD_OPERATORS = {
+    "over": "Raja ferry",
+    "lomlahkkhirin": "Lomprahah",
+}
+
+def load_information_lookup(target_csv_path):
+    """Load the id -> text info table written next to a dictionary-encoded ("csv-dict") schedules CSV.
+
+    The texts are categorical, so mapping a chunk's information_id column keeps one copy of each."""
+    base, _ = os.path.splitext(target_csv_path)
+    info_df = pd.read_csv(f"{base}_info.csv", dtype=str)
+    return pd.Series(pd.Categorical(info_df['text']), index=info_df['id'])
+
+def read_timetable(lookup_csv_path):
+    lookup_df = pd.read_csv(lookup_csv_path, dtype=str)
+
+    # Ensure consistent column names (strip whitespace)
+    lookup_df.columns = lookup_df.columns.str.strip()
+
+    # Drop the 'Unnamed: 5' column from lookup_df if it exists
+    if 'Unnamed: 5' in lookup_df.columns:
+        lookup_df = lookup_df.drop(columns=['Unnamed: 5'])
+    return lookup_df
+
+def timetable_station_index(lookup_df, valid_routes_file):
+    """Station index over the scraped locations (plus the timetable's city names, so "City (Pier)"
+    entries still join without valid_routes.json), learning pier aliases from the timetable."""
+    names = pd.concat([lookup_df['From'], lookup_df['To']]).dropna().unique()
+    cities = [split_pier(name)[0] for name in names]
+    return load_station_index(valid_routes_file, extra_names=cities, alias_names=names)
+
+def match_key_of(from_names, to_names, departures, station_index):
+    """MatchKey on canonical station IDs: "<from_id>_<to_id>_<HH:MM>"."""
+    return (
+        station_index.resolve_series(from_names) + "_" +
+        station_index.resolve_series(to_names) + "_" +
+        departures.astype("string").str.strip().str.zfill(5)  # "5:00" -> "05:00"
+    )
+
+def build_supplier_lookup(lookup_df, station_index):
+    """
+    Build the MatchKey -> supplier index from the timetable, keeping only keys
+    that map to exactly one supplier (ambiguous keys use the fallback).
+    """
+    match_key = match_key_of(lookup_df['From'], lookup_df['To'], lookup_df['Departure'], station_index)
+    suppliers = lookup_df['Supplier'].groupby(match_key)
+    unique = suppliers.nunique(dropna=False) == 1
+    # Categorical: a handful of operators repeat over every row they are mapped to.
+    return suppliers.first()[unique[unique].index].astype("category")
+
+def fill_operator_chunk(chunk, supplier_lookup, station_index, info_lookup=None):
+    """Vectorized operator fill for one chunk of the target CSV."""
+    # 1. Unique supplier for the From_To_Departure key on station IDs (primary method)
+    match_key = match_key_of(chunk['from_location'], chunk['to_location'], chunk['departure_time'],
+                             station_index)
+    operator = match_key.map(supplier_lookup)
+
+    # 2. Fallback: first word of 'information', with known first words mapped to operators
+    if 'information' in chunk.columns:
+        information = chunk['information']
+    elif info_lookup is not None and 'information_id' in chunk.columns:
+        information = chunk['information_id'].map(info_lookup)
+    else:
+        information = pd.Series(np.nan, index=chunk.index, dtype=object)
+    # "string" dtype: a chunk whose information is all blank is all-NA, which .str rejects on object columns
+    first_word = information.astype("string").str.split(n=1).str[0]
+    fallback = first_word.str.lower().map(FIRST_WORD_OPERATORS).fillna(first_word)
+
+    if not isinstance(operator.dtype, pd.CategoricalDtype):
+        operator = operator.astype("category")
+    # Add the fallback names as categories so the filled column stays categorical.
+    new_names = pd.Index(fallback.dropna().unique()).difference(operator.cat.categories)
+    chunk['operator'] = operator.cat.add_categories(new_names).fillna(fallback)
+    return chunk
+
+def fill_supplier(lookup_csv_path, target_csv_path, chunk_size=CHUNK_SIZE, valid_routes_file=None):
     """
     Fills the 'operator' column in the target CSV using a lookup CSV,
     with a fallback to the 'information' column.
-    Overwrites the original target CSV.
+    Timetable and scraped station names are joined on canonical station IDs
+    (see stations.py); valid_routes.json defaults to the one next to the timetable.
+    Streams the target in chunks and atomically replaces the original target CSV.
     """
 
+    tmp_path = None
     try:
-        # Load the CSVs
-        lookup_df = pd.read_csv(lookup_csv_path)
-        target_df = pd.read_csv(target_csv_path)
-
-        # Ensure consistent column names (strip whitespace)
-        lookup_df.columns = lookup_df.columns.str.strip()
-        target_df.columns = target_df.columns.str.strip()
-
-        # Drop the 'Unnamed: 5' column from lookup_df if it exists
-        if 'Unnamed: 5' in lookup_df.columns:
-            lookup_df = lookup_df.drop(columns=['Unnamed: 5'])
-
-        # --- Use Correct Column Names for ferry_schedules_final_final.csv ---
-        # Add 'operator' column to target if not present
-        if 'operator' not in target_df.columns:
-            target_df['operator'] = np.nan  # Initialize the operator column
-
-        # 1. Create a combined key for matching (Use correct column names!)
-        lookup_df['MatchKey'] = (
-            lookup_df['From'].str.strip() + "_" +
-            lookup_df['To'].str.strip() + "_" +
-            lookup_df['Departure'].str.strip()
-        )
-        target_df['MatchKey'] = (
-            target_df['from_location'].str.strip() + "_" +
-            target_df['to_location'].str.strip() + "_" +
-            target_df['departure_time'].str.strip()
-        )
-
-        # 2. Group the lookup table by the MatchKey and get unique suppliers.
-        lookup_grouped = lookup_df.groupby('MatchKey')['Supplier'].agg(lambda x: list(set(x))).reset_index()
-        lookup_grouped.rename(columns={'Supplier': 'PossibleSuppliers'}, inplace=True)
-
-        # 3. Merge the target data with the grouped lookup data.
-        merged_df = pd.merge(target_df, lookup_grouped, on='MatchKey', how='left')
-
-        # 4. Fill 'operator' based on uniqueness (primary method)
-        def determine_supplier(row):
-            if isinstance(row['PossibleSuppliers'], list) and len(row['PossibleSuppliers']) == 1:
-                return row['PossibleSuppliers'][0]
-            else:
-                return np.nan  # Remain NaN if not unique (to use fallback)
-
-        merged_df['operator'] = merged_df.apply(determine_supplier, axis=1)
-
-        # 5. Fallback: Use the first word of the 'information' column if operator is still NaN.
-        def fill_from_information(row):
-            if pd.isna(row['operator']) and isinstance(row['information'], str) and row['information'].strip():
-                first_word = row['information'].split()[0]
-                # Check for specific words (using lower() for case-insensitive matching)
-                if first_word.lower() == "over":
-                    return "Raja ferry"
-                elif first_word.lower() == "lomlahkkhirin":
-                    return "Lomprahah"
-                else:
-                    return first_word  # Otherwise, use the first word as is
-            else:
-                return row['operator']  # Return the existing value if already set
-
-        merged_df['operator'] = merged_df.apply(fill_from_information, axis=1)
-
-        # --- Cleanup ---
-        merged_df.drop(columns=['MatchKey', 'PossibleSuppliers'], inplace=True)
-
-        # --- Save the result (OVERWRITING the original target CSV) ---
-        merged_df.to_csv(target_csv_path, index=False)
-        print(f"Operator information filled and saved to: {target_csv_path}")
+        if valid_routes_file is None:
+            valid_routes_file = os.path.join(os.path.dirname(os.path.abspath(lookup_csv_path)), "valid_routes.json")
+        lookup_df = read_timetable(lookup_csv_path)
+        station_index = timetable_station_index(lookup_df, valid_routes_file)
+        supplier_lookup = build_supplier_lookup(lookup_df, station_index)
+
+        # Dictionary-encoded output ("csv-dict") stores information as IDs into <base>_info.csv
+        header = pd.read_csv(target_csv_path, nrows=0).columns.str.strip()
+        info_lookup = None
+        if 'information' not in header and 'information_id' in header:
+            info_lookup = load_information_lookup(target_csv_path)
+
+        # Write next to the target and rename at the end, so a crash never leaves a half-written file.
+        target_dir = os.path.dirname(os.path.abspath(target_csv_path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".fill_supplier-", suffix=".csv", dir=target_dir)
+        rows = 0
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as out:
+            # Read everything as text (only empty cells are missing) so values round-trip unchanged.
+            chunks = pd.read_csv(target_csv_path, dtype=str, keep_default_na=False, na_values=[""],
+                                 chunksize=chunk_size)
+            for i, chunk in enumerate(chunks):
+                chunk.columns = chunk.columns.str.strip()
+                chunk = fill_operator_chunk(chunk, supplier_lookup, station_index, info_lookup)
+                chunk.to_csv(out, index=False, header=(i == 0))
+                rows += len(chunk)
+        os.replace(tmp_path, target_csv_path)
+        tmp_path = None
+        print(f"Operator information filled for {rows} rows and saved to: {target_csv_path}")
 
     except FileNotFoundError:
         print("Error: One or both of the CSV files were not found.")
@@ -83,18 +129,31 @@ def fill_supplier(lookup_csv_path, target_csv_path):
         print(f"Error: A required column is missing in one of the CSVs: {e}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
-
-# --- File Paths ---
-lookup_csv_path = r"C:\Users\USER\Desktop\scrape\timetable.csv"
-target_csv_path = r"C:\Users\USER\Desktop\scrape\ferry_schedules_final_final.csv"
-
-# --- Run the Function ---
-fill_supplier(lookup_csv_path, target_csv_path)
-
-# Optional: Print the updated DataFrame (for verification)
-try:
-    updated_df = pd.read_csv(target_csv_path)
-    print("\nTarget CSV after filling operator:")
-    print(updated_df)
-except FileNotFoundError:
-    print("Could not print output.")
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fill the operator column of a scraped CSV from timetable.csv.")
+    parser.add_argument("lookup_csv", nargs="?", default="timetable.csv")
+    parser.add_argument("target_csv", nargs="?", default="ferry_schedules_final_final.csv")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--valid-routes", help="valid_routes.json (default: next to the timetable)")
+    parser.add_argument("--show", action="store_true", help="print the target CSV afterwards")
+    args = parser.parse_args()
+
+    fill_supplier(args.lookup_csv, args.target_csv, args.chunk_size, args.valid_routes)
+
+    # Optional: Print the updated DataFrame (for verification)
+    if args.show:
+        try:
+            updated_df = pd.read_csv(args.target_csv)
+            print("\nTarget CSV after filling operator:")
+            print(updated_df)
+        except FileNotFoundError:
+            print("Could not print output.")
+
+if __name__ == "__main__":
+    main()